@@ -0,0 +1,85 @@
+import os
+import json
+import threading
+
+
+class BuildCheckpoint:
+    """Durable progress of a graph build.
+
+    Keeps the names of finished load steps and, for client-side loads, the
+    number of rows of each file that have already been committed. Every
+    update is written to disk straight away, so a build that dies part way
+    can be restarted and pick up where it stopped. The progress belongs to
+    one build mode and plan (for delta builds, a digest of the rows to
+    reload), set with start().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.completed_steps = set()
+        self.offsets = {}
+        self.build_mode = None
+        self.plan = None
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+            self.completed_steps = set(state.get('completed_steps', []))
+            self.offsets = dict(state.get('offsets', {}))
+            self.build_mode = state.get('build_mode')
+            self.plan = state.get('plan')
+
+    def start(self, build_mode, plan=None):
+        """Resume the progress of build_mode and plan, or start them afresh.
+
+        Progress left by a different mode or plan is discarded, since its
+        steps and offsets do not apply to this build. Returns True if it was.
+        """
+        with self._lock:
+            discarded = self.has_progress() and (self.build_mode, self.plan) != (build_mode, plan)
+            if discarded:
+                self._clear()
+            self.build_mode = build_mode
+            self.plan = plan
+            return discarded
+
+    def has_progress(self):
+        return bool(self.completed_steps or self.offsets)
+
+    def is_complete(self, step):
+        return step in self.completed_steps
+
+    def mark_complete(self, step):
+        with self._lock:
+            self.completed_steps.add(step)
+            self._save()
+
+    def offset(self, csv_file):
+        return self.offsets.get(csv_file, 0)
+
+    def record_offset(self, csv_file, offset):
+        with self._lock:
+            self.offsets[csv_file] = offset
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self.completed_steps = set()
+        self.offsets = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _save(self):
+        # Write to a temporary file and swap it in so a crash never leaves a
+        # half-written checkpoint behind
+        state = {'build_mode': self.build_mode, 'plan': self.plan,
+                 'completed_steps': sorted(self.completed_steps), 'offsets': self.offsets}
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
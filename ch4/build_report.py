@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# ResultSummary counters kept for every step
+COUNTERS = ['nodes_created', 'nodes_deleted', 'relationships_created', 'relationships_deleted',
+            'properties_set', 'labels_added']
+
+
+class BuildReport:
+    """Collects wall time, rows read and write counters for each build step.
+
+    Steps are timed with step(); while a step runs, add() calls from the same
+    thread are attributed to it, so steps running in parallel do not mix
+    their numbers.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or {}
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.steps = {}
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._current = threading.local()
+
+    @contextmanager
+    def step(self, name):
+        with self._lock:
+            self.steps[name] = {'seconds': 0.0, 'rows_read': None, **{counter: 0 for counter in COUNTERS}}
+        self._current.name = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._current.name = None
+            with self._lock:
+                self.steps[name]['seconds'] = round(time.perf_counter() - start, 3)
+
+    def add(self, rows_read=None, counters=None):
+        name = getattr(self._current, 'name', None)
+        if name is None:
+            return
+        with self._lock:
+            stats = self.steps[name]
+            if rows_read is not None:
+                stats['rows_read'] = (stats['rows_read'] or 0) + rows_read
+            if counters is not None:
+                for counter in COUNTERS:
+                    stats[counter] += getattr(counters, counter)
+
+    def to_dict(self):
+        steps = {}
+        for name, stats in self.steps.items():
+            stats = dict(stats)
+            if stats['rows_read'] and stats['seconds']:
+                stats['rows_per_second'] = round(stats['rows_read'] / stats['seconds'], 1)
+            steps[name] = stats
+        return {
+            'started_at': self.started_at,
+            'total_seconds': round(time.perf_counter() - self._start, 3),
+            'config': self.config,
+            'steps': steps,
+        }
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def load_report(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_reports(previous, current):
+    """Print how each step's time and counters changed against a previous report."""
+    print(f"Build time: {previous['total_seconds']:.1f}s -> {current['total_seconds']:.1f}s")
+    for name, stats in current['steps'].items():
+        old = previous['steps'].get(name)
+        if old is None:
+            print(f"  {name}: {stats['seconds']:.1f}s (new step)")
+            continue
+        change = (stats['seconds'] - old['seconds']) / old['seconds'] * 100 if old['seconds'] else 0.0
+        line = f"  {name}: {old['seconds']:.1f}s -> {stats['seconds']:.1f}s ({change:+.0f}%)"
+        differences = [f"{counter} {old.get(counter)} -> {stats[counter]}"
+                       for counter in COUNTERS if old.get(counter) != stats[counter]]
+        if differences:
+            line += "; " + ", ".join(differences)
+        print(line)
+    for name in previous['steps'].keys() - current['steps'].keys():
+        print(f"  {name}: missing from this build")
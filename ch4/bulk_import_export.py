@@ -0,0 +1,241 @@
+import os
+import json
+import pandas as pd
+
+# Turns ch4/normalized_data into node and relationship files for the offline
+# bulk importer (neo4j-admin database import full). The files describe the
+# same graph CreateGraph builds with Cypher, so a cold build can skip the
+# MERGE path entirely; GRAPH_BUILD_MODE=schema then adds the constraints and
+# indexes. Run it from the ch4 directory.
+
+DATA_DIR = "normalized_data"
+OUTPUT_DIR = "import_data"
+MOVIE_LIMIT = 10000  # Same movie limit graph_build.py applies
+
+CREW_RELATIONSHIPS = {'Director': 'DIRECTED', 'Producer': 'PRODUCED'}
+
+
+def read_normalized(name):
+    # Keep every value as text so IDs like imdbId keep their leading zeros
+    return pd.read_csv(os.path.join(DATA_DIR, name), dtype=str, keep_default_na=False, na_values=[''])
+
+
+def to_int(series):
+    # Mirrors Cypher toInteger(): '1.0' -> 1, anything unparsable -> null
+    return pd.to_numeric(series, errors='coerce').astype('Int64')
+
+
+def count_duplicates(df, key_columns):
+    return int(df.duplicated(subset=key_columns).sum())
+
+
+def write_import_file(df, name, header):
+    # header maps DataFrame columns to their typed neo4j-admin header names
+    out = df[list(header)].rename(columns=header)
+    out.to_csv(os.path.join(OUTPUT_DIR, name), index=False)
+    return len(out)
+
+
+def build_movies(report):
+    movies = read_normalized('normalized_movies.csv')
+    rows = len(movies)
+    movies['tmdbId'] = to_int(movies['tmdbId'])
+    movies = movies.dropna(subset=['tmdbId']).head(MOVIE_LIMIT)
+    duplicates = count_duplicates(movies, ['tmdbId'])
+    # load_movies SETs properties on every row, so the last duplicate wins
+    movies = movies.drop_duplicates(subset=['tmdbId'], keep='last').copy()
+
+    for column in ['title', 'original_title', 'original_language', 'tagline', 'overview',
+                   'release_date', 'belongs_to_collection']:
+        movies[column] = movies[column].fillna("None")
+    movies['adult'] = to_int(movies['adult']).map(lambda x: 'Yes' if x == 1 else 'No')
+    movies['budget'] = to_int(movies['budget'].fillna('0'))
+    movies['revenue'] = to_int(movies['revenue'].fillna('0'))
+    movies['runtime'] = pd.to_numeric(movies['runtime'].fillna('0'), errors='coerce')
+
+    # Links are plain Movie properties in the Cypher build
+    links = read_normalized('normalized_links.csv')
+    link_rows = len(links)
+    links['tmdbId'] = to_int(links['tmdbId'])
+    links['movieId'] = to_int(links['movieId'])
+    link_dangling = int((~links['tmdbId'].isin(movies['tmdbId'])).sum())
+    links = links[links['tmdbId'].isin(movies['tmdbId'])]
+    link_duplicates = count_duplicates(links, ['tmdbId'])
+    links = links.drop_duplicates(subset=['tmdbId'], keep='last')
+    movies = movies.merge(links[['tmdbId', 'movieId', 'imdbId']], on='tmdbId', how='left')
+
+    movies['id'] = movies['tmdbId']
+    movies['label'] = 'Movie'
+    written = write_import_file(movies, 'movies.csv', {
+        'id': ':ID(Movie)', 'tmdbId': 'tmdbId:long', 'title': 'title', 'original_title': 'original_title',
+        'adult': 'adult', 'budget': 'budget:long', 'original_language': 'original_language',
+        'revenue': 'revenue:long', 'tagline': 'tagline', 'overview': 'overview',
+        'release_date': 'release_date', 'runtime': 'runtime:double',
+        'belongs_to_collection': 'belongs_to_collection', 'movieId': 'movieId:long',
+        'imdbId': 'imdbId', 'label': ':LABEL',
+    })
+    report['normalized_movies.csv'] = {'rows': rows, 'duplicate_keys': duplicates, 'dangling': 0, 'written': written}
+    report['normalized_links.csv'] = {'rows': link_rows, 'duplicate_keys': link_duplicates, 'dangling': link_dangling}
+    return movies
+
+
+def split_dangling(df, movie_ids, name, key_columns, report):
+    """Drop rows pointing at movies that are not loaded and record the counts."""
+    df['tmdbId'] = to_int(df['tmdbId'])
+    rows = len(df)
+    valid = df['tmdbId'].isin(movie_ids)
+    df = df[valid]
+    report[name] = {'rows': rows, 'dangling': int((~valid).sum()), 'duplicate_keys': count_duplicates(df, key_columns)}
+    # MERGE keeps the first version of a relationship
+    return df.drop_duplicates(subset=key_columns, keep='first').copy()
+
+
+def build_lookup(movie_ids, report, name, id_column, name_column, id_type, label, rel_type, file_stem):
+    """Export a Movie -> lookup node relationship file and its deduplicated nodes."""
+    df = split_dangling(read_normalized(name), movie_ids, name, ['tmdbId', id_column], report)
+    if id_type == 'long':
+        df[id_column] = to_int(df[id_column])
+    nodes = df.drop_duplicates(subset=[id_column], keep='first').copy()
+    nodes['id'] = nodes[id_column]
+    nodes['label'] = label
+    write_import_file(nodes, f'{file_stem}.csv', {
+        'id': f':ID({label})', id_column: f'{id_column}:{id_type}', name_column: name_column, 'label': ':LABEL',
+    })
+    df['type'] = rel_type
+    report[name]['written'] = write_import_file(df, f'{file_stem}_rels.csv', {
+        'tmdbId': ':START_ID(Movie)', id_column: f':END_ID({label})', 'type': ':TYPE',
+    })
+
+
+def build_keywords(movie_ids, report):
+    # Uses the integer-coded keyword tables rather than splitting the text
+    df = split_dangling(read_normalized('normalized_movie_keywords.csv'), movie_ids, 'normalized_movie_keywords.csv',
+                        ['tmdbId', 'keyword_id'], report)
+    df['keyword_id'] = to_int(df['keyword_id'])
+    vocabulary = read_normalized('normalized_keyword_vocabulary.csv')
+    vocabulary['keyword_id'] = to_int(vocabulary['keyword_id'])
+    nodes = vocabulary[vocabulary['keyword_id'].isin(df['keyword_id'])].copy()
+    nodes['id'] = nodes['keyword_id']
+    nodes['label'] = 'Keyword'
+    write_import_file(nodes, 'keywords.csv', {
+        'id': ':ID(Keyword)', 'keyword_id': 'keyword_id:long', 'keyword': 'name', 'label': ':LABEL',
+    })
+    df['type'] = 'HAS_KEYWORD'
+    report['normalized_movie_keywords.csv']['written'] = write_import_file(df, 'has_keyword.csv', {
+        'tmdbId': ':START_ID(Movie)', 'keyword_id': ':END_ID(Keyword)', 'type': ':TYPE',
+    })
+
+
+def build_people(movies, report):
+    movie_ids = movies['tmdbId']
+
+    cast = split_dangling(read_normalized('normalized_cast.csv'), movie_ids, 'normalized_cast.csv',
+                          ['tmdbId', 'actor_id'], report)
+    cast['actor_id'] = to_int(cast['actor_id'])
+    cast['cast_id'] = to_int(cast['cast_id'])
+    cast['character'] = cast['character'].fillna("None")
+    actors = cast.drop_duplicates(subset=['actor_id'], keep='first').copy()
+    actors['id'] = actors['actor_id']
+    actors['role'] = 'actor'
+    actors['label'] = 'Person;Actor'
+    write_import_file(actors, 'actors.csv', {
+        'id': ':ID(Actor)', 'actor_id': 'actor_id:long', 'name': 'name', 'role': 'role', 'label': ':LABEL',
+    })
+    cast['type'] = 'ACTED_IN'
+    report['normalized_cast.csv']['written'] = write_import_file(cast, 'acted_in.csv', {
+        'actor_id': ':START_ID(Actor)', 'tmdbId': ':END_ID(Movie)', 'character': 'character',
+        'cast_id': 'cast_id:long', 'type': ':TYPE',
+    })
+
+    crew = split_dangling(read_normalized('normalized_crew.csv'), movie_ids, 'normalized_crew.csv',
+                          ['tmdbId', 'crew_id', 'job'], report)
+    crew = crew[crew['job'].isin(CREW_RELATIONSHIPS)].copy()
+    crew['crew_id'] = to_int(crew['crew_id'])
+    # Directors are loaded before producers, so a person's role is their
+    # first job in that order
+    crew['job_order'] = crew['job'].map(list(CREW_RELATIONSHIPS).index)
+    members = crew.sort_values('job_order', kind='stable').drop_duplicates(subset=['crew_id'], keep='first').copy()
+    members['id'] = members['crew_id']
+    members['role'] = members['job']
+    members['label'] = 'Person;' + members['job']
+    write_import_file(members, 'crew.csv', {
+        'id': ':ID(Crew)', 'crew_id': 'crew_id:long', 'name': 'name', 'role': 'role', 'label': ':LABEL',
+    })
+    crew['type'] = crew['job'].map(CREW_RELATIONSHIPS)
+    report['normalized_crew.csv']['written'] = write_import_file(crew, 'crew_rels.csv', {
+        'crew_id': ':START_ID(Crew)', 'tmdbId': ':END_ID(Movie)', 'type': ':TYPE',
+    })
+
+    # Ratings reference movies by movieId, which only linked movies have
+    ratings = read_normalized('normalized_ratings_small.csv')
+    rows = len(ratings)
+    ratings['movieId'] = to_int(ratings['movieId'])
+    movie_lookup = movies.dropna(subset=['movieId']).set_index('movieId')['tmdbId']
+    ratings['tmdbId'] = ratings['movieId'].map(movie_lookup)
+    valid = ratings['tmdbId'].notna()
+    ratings = ratings[valid].copy()
+    report['normalized_ratings_small.csv'] = {'rows': rows, 'dangling': int((~valid).sum()),
+                                              'duplicate_keys': count_duplicates(ratings, ['userId', 'movieId'])}
+    ratings = ratings.drop_duplicates(subset=['userId', 'movieId'], keep='first').copy()
+    ratings['userId'] = to_int(ratings['userId'])
+    ratings['tmdbId'] = ratings['tmdbId'].astype('Int64')
+    ratings['rating'] = pd.to_numeric(ratings['rating'], errors='coerce')
+    ratings['timestamp'] = to_int(ratings['timestamp'])
+    users = ratings.drop_duplicates(subset=['userId']).copy()
+    users['id'] = users['userId']
+    users['role'] = 'user'
+    users['label'] = 'Person;User'
+    write_import_file(users, 'users.csv', {
+        'id': ':ID(User)', 'userId': 'user_id:long', 'role': 'role', 'label': ':LABEL',
+    })
+    ratings['type'] = 'RATED'
+    report['normalized_ratings_small.csv']['written'] = write_import_file(ratings, 'rated.csv', {
+        'userId': ':START_ID(User)', 'tmdbId': ':END_ID(Movie)', 'rating': 'rating:double',
+        'timestamp': 'timestamp:long', 'type': ':TYPE',
+    })
+
+
+def import_command():
+    nodes = ['movies', 'genres', 'production_companies', 'countries', 'spoken_languages', 'keywords',
+             'actors', 'crew', 'users']
+    relationships = ['genres_rels', 'production_companies_rels', 'countries_rels', 'spoken_languages_rels',
+                     'has_keyword', 'acted_in', 'crew_rels', 'rated']
+    args = [f"--nodes={os.path.join(OUTPUT_DIR, name)}.csv" for name in nodes]
+    args += [f"--relationships={os.path.join(OUTPUT_DIR, name)}.csv" for name in relationships]
+    return ("neo4j-admin database import full neo4j --overwrite-destination --multiline-fields=true \\\n  "
+            + " \\\n  ".join(args))
+
+
+def main():
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
+
+    report = {}
+    movies = build_movies(report)
+    movie_ids = movies['tmdbId']
+    build_lookup(movie_ids, report, 'normalized_genres.csv', 'genre_id', 'genre_name', 'long',
+                 'Genre', 'HAS_GENRE', 'genres')
+    build_lookup(movie_ids, report, 'normalized_production_companies.csv', 'company_id', 'company_name', 'long',
+                 'ProductionCompany', 'PRODUCED_BY', 'production_companies')
+    build_lookup(movie_ids, report, 'normalized_production_countries.csv', 'country_code', 'country_name', 'string',
+                 'Country', 'PRODUCED_IN', 'countries')
+    build_lookup(movie_ids, report, 'normalized_spoken_languages.csv', 'language_code', 'language_name', 'string',
+                 'SpokenLanguage', 'HAS_LANGUAGE', 'spoken_languages')
+    build_keywords(movie_ids, report)
+    build_people(movies, report)
+
+    with open(os.path.join(OUTPUT_DIR, 'validation_report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print("Validation report (rows pointing at missing movies are dropped, duplicate keys are merged):")
+    for name, stats in report.items():
+        print(f"  {name}: {stats}")
+    print("\nStop the database, then import with:")
+    print(import_command())
+    # The importer writes no schema, and the loaders and search rely on it
+    print("\nThen start the database and create the constraints and indexes with:")
+    print("GRAPH_BUILD_MODE=schema python graph_build.py")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+import json
+import hashlib
+from table_reader import iter_rows
+
+# Joins the key columns of a row into a single manifest key
+KEY_SEPARATOR = '|'
+
+
+def _text(value):
+    # Typed Parquet values are hashed as their CSV text
+    return '' if value is None else str(value)
+
+
+def row_key(row, key_columns):
+    return KEY_SEPARATOR.join(_text(row[column]) for column in key_columns)
+
+
+def split_row_key(key, key_columns):
+    return dict(zip(key_columns, key.split(KEY_SEPARATOR)))
+
+
+def compute_row_hashes(csv_file, key_columns, limit=None, row_filter=None):
+    """Map the key of every row in csv_file to a hash of the row's content.
+
+    Rows sharing a key (for example an actor credited twice in one movie)
+    are folded into one hash, so the key changes whenever any of them does.
+    limit and row_filter select rows the same way the graph loaders do.
+    """
+    hashes = {}
+    taken = 0
+    for row in iter_rows(csv_file):
+        if limit is not None and taken >= limit:
+            break
+        if row_filter is not None and not row_filter(row):
+            continue
+        taken += 1
+        key = row_key(row, key_columns)
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(hashes.get(key, '').encode('utf-8'))
+        digest.update('\x1f'.join(_text(value) for value in row.values()).encode('utf-8'))
+        hashes[key] = digest.hexdigest()
+    return hashes
+
+
+def diff_row_hashes(previous, current):
+    """Return (changed, deleted) keys between two hash maps.
+
+    changed holds keys that are new or whose content differs; deleted holds
+    keys that only exist in previous.
+    """
+    changed = {key for key, digest in current.items() if previous.get(key) != digest}
+    deleted = previous.keys() - current.keys()
+    return changed, deleted
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
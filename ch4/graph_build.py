@@ -1,28 +1,507 @@
 import os
+import re
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import partial
 from neo4j import GraphDatabase
+from neo4j.exceptions import Neo4jError, TransientError
 from dotenv import load_dotenv
+from build_checkpoint import BuildCheckpoint
+from build_report import BuildReport, load_report, compare_reports
+from table_reader import iter_rows, table_name
+from delta_manifest import (KEY_SEPARATOR, compute_row_hashes, diff_row_hashes, row_key, split_row_key,
+                            load_manifest, save_manifest)
 import warnings
 
 warnings.filterwarnings("ignore")
 load_dotenv()
 
+# Where the normalized CSVs live for each load mode
+REMOTE_DATA_URL = 'https://storage.googleapis.com/movies-packt'
+LOCAL_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'normalized_data')
+
+# 'remote' runs server-side LOAD CSV over HTTPS, 'local' streams the files from
+# LOCAL_DATA_DIR and sends them to Neo4j as parameterized UNWIND batches
+LOAD_MODE = os.getenv('GRAPH_LOAD_MODE', 'remote')
+LOAD_BATCH_SIZE = int(os.getenv('GRAPH_LOAD_BATCH_SIZE', '10000'))
+# Maximum number of load steps running at the same time
+LOAD_WORKERS = int(os.getenv('GRAPH_LOAD_WORKERS', '4'))
+# 'parquet' makes local loads read the typed files written by the normalizing
+# scripts with NORMALIZE_FORMAT=parquet, falling back to the CSV of a table
+# that has no Parquet file (links and ratings are only shipped as CSV)
+DATA_FORMAT = os.getenv('GRAPH_DATA_FORMAT', 'csv')
+# Cleanup deletes in transactions of this many relationships/nodes. It can
+# drop the schema first (deletes then skip index maintenance) or recreate the
+# whole database when the server allows it (Enterprise, admin user)
+CLEANUP_BATCH_SIZE = int(os.getenv('GRAPH_CLEANUP_BATCH_SIZE', '10000'))
+CLEANUP_DROP_SCHEMA = os.getenv('GRAPH_CLEANUP_DROP_SCHEMA', 'false').lower() == 'true'
+CLEANUP_DROP_DATABASE = os.getenv('GRAPH_CLEANUP_DROP_DATABASE', 'false').lower() == 'true'
+
+# Progress file used to resume an interrupted build
+CHECKPOINT_FILE = os.getenv('GRAPH_CHECKPOINT_FILE',
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'build_checkpoint.json'))
+
+# 'full' wipes the database and reloads everything, 'delta' only sends the
+# rows that changed since the snapshot manifest written by the last build,
+# 'schema' only creates the constraints and indexes (after a bulk import)
+BUILD_MODE = os.getenv('GRAPH_BUILD_MODE', 'full')
+MANIFEST_FILE = os.getenv('GRAPH_MANIFEST_FILE',
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), 'build_manifest.json'))
+
+# Machine-readable timings and write counters of the build. It is compared
+# against GRAPH_BUILD_REPORT_BASELINE, or the previous report when unset
+REPORT_FILE = os.getenv('GRAPH_BUILD_REPORT',
+                        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'build_report.json'))
+REPORT_BASELINE = os.getenv('GRAPH_BUILD_REPORT_BASELINE', REPORT_FILE)
+
+# Normalized file read by each load step
+STEP_FILES = {
+    'movies': 'normalized_movies.csv',
+    'genres': 'normalized_genres.csv',
+    'production_companies': 'normalized_production_companies.csv',
+    'production_countries': 'normalized_production_countries.csv',
+    'spoken_languages': 'normalized_spoken_languages.csv',
+    'keywords': 'normalized_keywords.csv',
+    'actors': 'normalized_cast.csv',
+    'crew': 'normalized_crew.csv',
+    'links': 'normalized_links.csv',
+    'ratings': 'normalized_ratings_small.csv',
+}
+# Local loads link movies to keywords through the integer-coded table written
+# by normalize_keywords.py instead of splitting the aggregated keyword text
+LOCAL_STEP_FILES = {
+    **STEP_FILES,
+    'keywords': 'normalized_movie_keywords.csv',
+}
+KEYWORD_VOCABULARY_FILE = 'normalized_keyword_vocabulary.csv'
+
+# Delta loads: the columns identifying a row of each file, the query removing
+# what a row created, and whether an updated row has to be removed before it
+# is loaded again (relationship properties are only set on create; node
+# names are SET on every load, so an updated row renames its node)
+DELTA_TABLES = {
+    'normalized_movies.csv': (('tmdbId',), """
+        MATCH (m:Movie {tmdbId: toInteger(row.tmdbId)})
+        DETACH DELETE m
+        """, False),
+    'normalized_genres.csv': (('tmdbId', 'genre_id'), """
+        MATCH (:Movie {tmdbId: toInteger(row.tmdbId)})-[r:HAS_GENRE]->(:Genre {genre_id: toInteger(row.genre_id)})
+        DELETE r
+        """, True),
+    'normalized_production_companies.csv': (('tmdbId', 'company_id'), """
+        MATCH (:Movie {tmdbId: toInteger(row.tmdbId)})-[r:PRODUCED_BY]->(:ProductionCompany {company_id: toInteger(row.company_id)})
+        DELETE r
+        """, True),
+    'normalized_production_countries.csv': (('tmdbId', 'country_code'), """
+        MATCH (:Movie {tmdbId: toInteger(row.tmdbId)})-[r:PRODUCED_IN]->(:Country {country_code: row.country_code})
+        DELETE r
+        """, True),
+    'normalized_spoken_languages.csv': (('tmdbId', 'language_code'), """
+        MATCH (:Movie {tmdbId: toInteger(row.tmdbId)})-[r:HAS_LANGUAGE]->(:SpokenLanguage {language_code: row.language_code})
+        DELETE r
+        """, True),
+    'normalized_movie_keywords.csv': (('tmdbId', 'keyword_id'), """
+        MATCH (:Movie {tmdbId: toInteger(row.tmdbId)})-[r:HAS_KEYWORD]->(:Keyword {keyword_id: toInteger(row.keyword_id)})
+        DELETE r
+        """, True),
+    'normalized_cast.csv': (('tmdbId', 'actor_id'), """
+        MATCH (:Person {actor_id: toInteger(row.actor_id)})-[r:ACTED_IN]->(:Movie {tmdbId: toInteger(row.tmdbId)})
+        DELETE r
+        """, True),
+    'normalized_crew.csv': (('tmdbId', 'crew_id', 'job'), """
+        MATCH (:Person {crew_id: toInteger(row.crew_id)})-[r:DIRECTED|PRODUCED]->(:Movie {tmdbId: toInteger(row.tmdbId)})
+        WHERE type(r) = CASE row.job WHEN 'Director' THEN 'DIRECTED' ELSE 'PRODUCED' END
+        DELETE r
+        """, True),
+    'normalized_links.csv': (('tmdbId',), """
+        MATCH (m:Movie {tmdbId: toInteger(row.tmdbId)})
+        REMOVE m.movieId, m.imdbId
+        """, False),
+    'normalized_ratings_small.csv': (('userId', 'movieId'), """
+        MATCH (:Person {user_id: toInteger(row.userId)})-[r:RATED]->(:Movie {movieId: toInteger(row.movieId)})
+        DELETE r
+        """, True),
+}
+
+# Relationship created for each crew job
+CREW_RELATIONSHIPS = {
+    'Director': 'DIRECTED',
+    'Producer': 'PRODUCED',
+}
+
+# Secondary labels given to Person nodes, keyed by their role property
+PERSON_ROLE_LABELS = {
+    'actor': 'Actor',
+    'Director': 'Director',
+    'Producer': 'Producer',
+    'user': 'User',
+}
+
+
+def read_batches(data_file, batch_size, columns=None, limit=None, row_filter=None, skip=0, row_map=None):
+    """Yield lists of at most batch_size rows from a local CSV or Parquet file.
+
+    Empty fields become None so the Cypher coalesce() defaults behave the same
+    way they do with LOAD CSV. columns limits the fields read from the file.
+    limit caps the number of rows accepted by row_filter, and the first skip
+    accepted rows are not yielded. row_map, when given, is applied to every
+    yielded row.
+    """
+    batch = []
+    taken = 0
+    for row in iter_rows(data_file, columns):
+        if limit is not None and taken >= limit:
+            break
+        if row_filter is not None and not row_filter(row):
+            continue
+        taken += 1
+        if taken <= skip:
+            continue
+        batch.append(row_map(row) if row_map is not None else row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def row_columns(row_query):
+    """Fields of `row` a row query refers to."""
+    return set(re.findall(r'\brow\.(\w+)', row_query))
+
+
+def has_integer_tmdb_id(row):
+    try:
+        int(row['tmdbId'])
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _integer(value):
+    # IDs as toInteger() reads them, so '862' and '862.0' name the same movie
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _write_batch(tx, query, rows):
+    return tx.run(query, rows=rows).consume()
+
+
+def _run_autocommit(session, query, retries=3, **params):
+    """Run query, returning its records and its summary."""
+    # Steps running in parallel can deadlock on shared Movie nodes. A failed
+    # statement is rolled back (or, with IN TRANSACTIONS, only partly committed
+    # MERGEs), so running it again is safe.
+    for attempt in range(retries):
+        try:
+            result = session.run(query, **params)
+            records = list(result)
+            return records, result.consume()
+        except TransientError:
+            if attempt == retries - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+
+def run_load_plan(steps, max_workers=LOAD_WORKERS, checkpoint=None, report=None):
+    """Run load steps concurrently while respecting their dependencies.
+
+    steps maps a step name to a (callable, dependencies) pair. A step is
+    started as soon as every step it depends on has finished, with at most
+    max_workers steps in flight. The first failing step stops the build.
+    Steps already marked complete in checkpoint are skipped, and every step
+    that runs is timed in report.
+    """
+    for name, (_, deps) in steps.items():
+        unknown = set(deps) - set(steps)
+        if unknown:
+            raise ValueError(f"Load step '{name}' depends on unknown steps: {sorted(unknown)}")
+
+    pending = dict(steps)
+    done = set()
+    if checkpoint is not None:
+        for name in list(pending):
+            if checkpoint.is_complete(name):
+                print(f"Skipping {name}, already loaded")
+                done.add(name)
+                del pending[name]
+    def run_step(name, func):
+        if report is None:
+            return func()
+        with report.step(name):
+            return func()
+
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for name, (func, deps) in list(pending.items()):
+                if done.issuperset(deps):
+                    running[executor.submit(run_step, name, func)] = name
+                    del pending[name]
+            if not running:
+                raise ValueError(f"Load steps have circular dependencies: {sorted(pending)}")
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                future.result()
+                done.add(name)
+                if checkpoint is not None:
+                    checkpoint.mark_complete(name)
+
 class CreateGraph:
 
-    def __init__(self, uri, user, password, database='neo4j'):
+    def __init__(self, uri, user, password, database='neo4j', mode='remote', batch_size=10000, checkpoint=None,
+                 report=None):
         self.driver = GraphDatabase.driver(uri, auth=(user, password), database=database)
+        self.database = database
+        self.mode = mode
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.report = report
+        # Set by prepare_delta: csv_file -> keys of the rows to (re)load
+        self.delta_keys = None
+
+    def data_file(self, name):
+        if self.mode == 'local':
+            if DATA_FORMAT == 'parquet':
+                parquet_file = os.path.join(LOCAL_DATA_DIR, os.path.splitext(name)[0] + '.parquet')
+                if os.path.exists(parquet_file):
+                    return parquet_file
+            return os.path.join(LOCAL_DATA_DIR, name)
+        return f'{REMOTE_DATA_URL}/{name}'
+
+    def step_file(self, step):
+        """File read by a load step in the current mode."""
+        step_files = LOCAL_STEP_FILES if self.mode == 'local' else STEP_FILES
+        return self.data_file(step_files[step])
+
+    def _run_load(self, csv_file, row_query, in_transactions=False, limit=None, row_filter=None, progress_key=None,
+                  row_map=None):
+        """Run row_query for every row of csv_file.
+
+        row_query is the Cypher that follows the row source and refers to each
+        CSV line as `row`. In remote mode the server pulls the file with LOAD
+        CSV; in local mode the file (CSV or Parquet) is read here, projected to
+        the fields the query uses, and sent in UNWIND batches of
+        self.batch_size rows, one write transaction per batch. Every query is
+        a MERGE or SET, so a batch that is sent twice changes nothing; with a
+        checkpoint, local loads record each committed batch under
+        progress_key (the file name by default) and resume from the last one.
+        """
+        progress_key = progress_key or csv_file
+        row_query = row_query.strip().rstrip(';')
+        if self.mode != 'local':
+            if in_transactions:
+                row_query = f"CALL (row){{\n{row_query}\n}}IN TRANSACTIONS OF 50000 ROWS"
+            # The server counts the rows reaching the end of the query: every
+            # line of the file for IN TRANSACTIONS steps, the rows within the
+            # limit or matching a movie for the others
+            query = f"LOAD CSV WITH HEADERS FROM $csvFile AS row\n{row_query}\nRETURN count(*) AS rows_read;"
+            with self.driver.session() as session:
+                records, summary = _run_autocommit(session, query, csvFile=f'{csv_file}')
+            self._record(records[0]['rows_read'], summary)
+            return
+
+        # Only the fields the query uses are read, which for Parquet means
+        # only those columns are loaded from disk
+        columns = row_columns(row_query)
+        if self.delta_keys is not None:
+            columns.update(DELTA_TABLES[table_name(csv_file)][0])
+            row_filter = self._delta_row_filter(csv_file, row_filter)
+
+        query = f"UNWIND $rows AS row\n{row_query}"
+        offset = self.checkpoint.offset(progress_key) if self.checkpoint is not None else 0
+        if offset:
+            print(f"  Resuming {os.path.basename(csv_file)} after row {offset}")
+        rows_loaded = 0
+        start = time.perf_counter()
+        with self.driver.session() as session:
+            for batch in read_batches(csv_file, self.batch_size, columns=columns, limit=limit, row_filter=row_filter,
+                                       skip=offset, row_map=row_map):
+                summary = session.execute_write(_write_batch, query, batch)
+                self._record(len(batch), summary)
+                rows_loaded += len(batch)
+                if self.checkpoint is not None:
+                    self.checkpoint.record_offset(progress_key, offset + rows_loaded)
+        elapsed = time.perf_counter() - start
+        rate = rows_loaded / elapsed if elapsed > 0 else 0.0
+        print(f"  {rows_loaded} rows from {os.path.basename(csv_file)} in {elapsed:.2f}s ({rate:.0f} rows/s)")
+
+    def _record(self, rows_read=None, summary=None):
+        if self.report is not None:
+            self.report.add(rows_read, summary.counters if summary is not None else None)
+
+    def _delta_row_filter(self, csv_file, row_filter):
+        key_columns = DELTA_TABLES[table_name(csv_file)][0]
+        keys = self.delta_keys.get(csv_file, set())
+
+        def is_changed(row):
+            if row_filter is not None and not row_filter(row):
+                return False
+            return row_key(row, key_columns) in keys
+        return is_changed
+
+    def snapshot_rows(self, movie_limit):
+        """Hash every row of the local normalized files for the delta manifest."""
+        manifest = {}
+        for step, name in LOCAL_STEP_FILES.items():
+            key_columns = DELTA_TABLES[name][0]
+            if step == 'movies':
+                manifest[name] = compute_row_hashes(self.step_file(step), key_columns,
+                                                    limit=movie_limit, row_filter=has_integer_tmdb_id)
+            else:
+                manifest[name] = compute_row_hashes(self.step_file(step), key_columns)
+        return manifest
+
+    def prepare_delta(self, previous, movie_limit):
+        """Compare the normalized files with the previous manifest.
+
+        Removes deleted rows from the graph right away, and the old version of
+        updated relationship rows, then limits the loaders to new and updated
+        rows. Every row of a movie new to the build counts as new, since the
+        previous build skipped them while the movie was missing. The plan is
+        tied to the checkpoint: a resumed delta build skips the deletes it
+        already ran. Returns the new manifest, to be saved once the load
+        succeeds.
+        """
+        current = self.snapshot_rows(movie_limit)
+        movies_file = LOCAL_STEP_FILES['movies']
+        new_movies = self._movie_ids(current[movies_file].keys() - previous.get(movies_file, {}).keys())
+        plan = {}
+        for name, hashes in current.items():
+            key_columns, _, replace_on_update = DELTA_TABLES[name]
+            old_hashes = previous.get(name, {})
+            changed, deleted = diff_row_hashes(old_hashes, hashes)
+            changed |= self._rows_of_movies(hashes, key_columns, new_movies)
+            stale = deleted | (changed & old_hashes.keys()) if replace_on_update else deleted
+            plan[name] = (changed, stale, deleted)
+
+        digest = hashlib.blake2b(digest_size=16)
+        for name, (changed, stale, _) in sorted(plan.items()):
+            digest.update(json.dumps([name, sorted(changed), sorted(stale)]).encode('utf-8'))
+        if self.checkpoint is not None:
+            if self.checkpoint.start('delta', digest.hexdigest()):
+                print("Discarded the checkpoint of a different build")
+            if self.checkpoint.has_progress():
+                print(f"Resuming interrupted delta build from {self.checkpoint.path}")
+
+        self.delta_keys = {}
+        for step, name in LOCAL_STEP_FILES.items():
+            changed, stale, deleted = plan[name]
+            key_columns, delete_query, _ = DELTA_TABLES[name]
+            # Deleting again would remove rows a resumed loader does not reload
+            deletes_done = f'{step}_deletes'
+            if self.checkpoint is not None and self.checkpoint.is_complete(deletes_done):
+                print(f"Skipping {step} deletes, already done")
+            else:
+                self.delete_rows(delete_query, [split_row_key(key, key_columns) for key in sorted(stale)])
+                if self.checkpoint is not None:
+                    self.checkpoint.mark_complete(deletes_done)
+            self.delta_keys[self.data_file(name)] = changed
+            print(f"{name}: {len(changed)} new or updated rows, {len(deleted)} deleted rows")
+        return current
+
+    def _movie_ids(self, tmdb_keys):
+        """Return (tmdbIds, movieIds) of the movies with the given manifest keys."""
+        tmdb_ids = {_integer(key) for key in tmdb_keys} - {None}
+        movie_ids = set()
+        if tmdb_ids:
+            for row in iter_rows(self.step_file('links')):
+                if _integer(row['tmdbId']) in tmdb_ids:
+                    movie_ids.add(_integer(row['movieId']))
+        return tmdb_ids, movie_ids - {None}
+
+    @staticmethod
+    def _rows_of_movies(hashes, key_columns, movies):
+        # Ratings name their movie by movieId, every other file by tmdbId
+        tmdb_ids, movie_ids = movies
+        column, ids = ('tmdbId', tmdb_ids) if 'tmdbId' in key_columns else ('movieId', movie_ids)
+        if not ids:
+            return set()
+        position = key_columns.index(column)
+        return {key for key in hashes if _integer(key.split(KEY_SEPARATOR)[position]) in ids}
+
+    def delete_rows(self, delete_query, rows):
+        query = f"UNWIND $rows AS row\n{delete_query}"
+        with self.driver.session() as session:
+            for start in range(0, len(rows), self.batch_size):
+                summary = session.execute_write(_write_batch, query, rows[start:start + self.batch_size])
+                self._record(summary=summary)
 
     def close(self):
         self.driver.close()
 
-    def db_cleanup(self):
-        print("Doing Database Cleanup.")
-        query = """
-        MATCH (n) DETACH DELETE (n)
+    def db_cleanup(self, batch_size=10000, drop_schema=False, drop_database=False):
+        """Empty the database.
+
+        Relationships and then nodes are deleted in transactions of at most
+        batch_size entities, so memory stays bounded on a fully loaded graph.
+        drop_schema removes constraints and indexes first (they are created
+        again by create_constraints_indexes). drop_database tries to replace
+        the whole database instead and falls back to batched deletes when the
+        server does not allow it.
         """
+        print("Doing Database Cleanup.")
+        if drop_database and self._recreate_database():
+            print("Database Cleanup Done. Using blank database.")
+            return
+        if drop_schema:
+            self.drop_constraints_indexes()
+
         with self.driver.session() as session:
-            session.run(query)
+            self._delete_in_batches(session, "relationships", """
+            MATCH ()-[r]->() WITH r LIMIT $batchSize
+            DELETE r
+            RETURN count(*) AS deleted
+            """, "MATCH ()-[r]->() RETURN count(r) AS total", batch_size)
+            self._delete_in_batches(session, "nodes", """
+            MATCH (n) WITH n LIMIT $batchSize
+            DETACH DELETE n
+            RETURN count(*) AS deleted
+            """, "MATCH (n) RETURN count(n) AS total", batch_size)
             print("Database Cleanup Done. Using blank database.")
 
+    @staticmethod
+    def _delete_in_batches(session, what, delete_query, count_query, batch_size):
+        total = session.run(count_query).single()["total"]
+        deleted = 0
+        start = time.perf_counter()
+        while True:
+            batch_deleted = session.execute_write(
+                lambda tx: tx.run(delete_query, batchSize=batch_size).single()["deleted"])
+            if batch_deleted == 0:
+                break
+            deleted += batch_deleted
+            elapsed = time.perf_counter() - start
+            rate = deleted / elapsed if elapsed > 0 else 0.0
+            print(f"  Deleted {deleted}/{total} {what} ({rate:.0f} {what}/s)")
+
+    def _recreate_database(self):
+        try:
+            with self.driver.session(database="system") as session:
+                session.run(f"CREATE OR REPLACE DATABASE `{self.database}` WAIT").consume()
+        except Neo4jError as e:
+            print(f"Could not recreate database ({e.code}), deleting in batches instead")
+            return False
+        return True
+
+    def drop_constraints_indexes(self):
+        with self.driver.session() as session:
+            constraints = [record["name"] for record in session.run("SHOW CONSTRAINTS YIELD name")]
+            for name in constraints:
+                session.run(f"DROP CONSTRAINT `{name}` IF EXISTS").consume()
+            # Lookup indexes back label and type scans, leave them in place
+            indexes = [record["name"] for record in
+                       session.run("SHOW INDEXES YIELD name, type WHERE type <> 'LOOKUP' RETURN name")]
+            for name in indexes:
+                session.run(f"DROP INDEX `{name}` IF EXISTS").consume()
+        print(f"Dropped {len(constraints)} constraints and {len(indexes)} indexes.")
+
     def create_constraints_indexes(self):
         queries = [
             "CREATE CONSTRAINT unique_tmdb_id IF NOT EXISTS FOR (m:Movie) REQUIRE m.tmdbId IS UNIQUE;",
@@ -31,10 +510,14 @@ class CreateGraph:
             "CREATE CONSTRAINT unique_genre_id IF NOT EXISTS FOR (g:Genre) REQUIRE g.genre_id IS UNIQUE;",
             "CREATE CONSTRAINT unique_lang_id IF NOT EXISTS FOR (l:SpokenLanguage) REQUIRE l.language_code IS UNIQUE;",
             "CREATE CONSTRAINT unique_country_id IF NOT EXISTS FOR (c:Country) REQUIRE c.country_code IS UNIQUE;",
+            "CREATE CONSTRAINT unique_keyword_name IF NOT EXISTS FOR (k:Keyword) REQUIRE k.name IS UNIQUE;",
+            "CREATE FULLTEXT INDEX keyword_names IF NOT EXISTS FOR (k:Keyword) ON EACH [k.name];",
+            "CREATE INDEX keyword_id IF NOT EXISTS FOR (k:Keyword) ON (k.keyword_id);",
             "CREATE INDEX actor_id IF NOT EXISTS FOR (p:Person) ON (p.actor_id);",
             "CREATE INDEX crew_id IF NOT EXISTS FOR (p:Person) ON (p.crew_id);",
             "CREATE INDEX movieId IF NOT EXISTS FOR (m:Movie) ON (m.movieId);",
-            "CREATE INDEX user_id IF NOT EXISTS FOR (p:Person) ON (p.user_id);"
+            "CREATE INDEX user_id IF NOT EXISTS FOR (p:Person) ON (p.user_id);",
+            "CREATE INDEX person_role IF NOT EXISTS FOR (p:Person) ON (p.role);"
         ]
         with self.driver.session() as session:
             for query in queries:
@@ -42,183 +525,210 @@ class CreateGraph:
             print("Constraints and Indexes created successfully.")
 
 
+    def load_steps(self, movie_limit):
+        """Return the build's load steps for run_load_plan.
+
+        Everything after movies writes its own node labels and only matches
+        Movie nodes, so those steps can run side by side. Ratings match
+        movies on movieId, which load_links sets, so they wait for links.
+        """
+        return {
+            'movies': (partial(self.load_movies, self.step_file('movies'), movie_limit), ()),
+            'genres': (partial(self.load_genres, self.step_file('genres')), ('movies',)),
+            'production_companies': (partial(self.load_production_companies, self.step_file('production_companies')), ('movies',)),
+            'production_countries': (partial(self.load_production_countries, self.step_file('production_countries')), ('movies',)),
+            'spoken_languages': (partial(self.load_spoken_languages, self.step_file('spoken_languages')), ('movies',)),
+            'keywords': (partial(self.load_movie_keywords if self.mode == 'local' else self.load_keywords,
+                                 self.step_file('keywords')), ('movies',)),
+            'actors': (partial(self.load_person_actors, self.step_file('actors')), ('movies',)),
+            'crew': (partial(self.load_person_crew, self.step_file('crew')), ('movies',)),
+            'links': (partial(self.load_links, self.step_file('links')), ('movies',)),
+            'ratings': (partial(self.load_ratings, self.step_file('ratings')), ('links',)),
+            'person_labels': (self.backfill_person_labels, ('actors', 'crew', 'ratings')),
+        }
+
     def load_movies(self, csv_file, limit):
+        # In local mode the limit is applied while reading the file. Properties
+        # are SET on every load, not only on create, so delta loads update them
+        limit_clause = f"LIMIT {limit}" if self.mode != 'local' else ""
         query = f"""
-        LOAD CSV WITH HEADERS FROM $csvFile AS row
         WITH row, toInteger(row.tmdbId) AS tmdbId
         WHERE tmdbId IS NOT NULL
         WITH row, tmdbId
-        LIMIT {limit}
+        {limit_clause}
         MERGE (m:Movie {{tmdbId: tmdbId}})
-        ON CREATE SET m.title = coalesce(row.title, "None"),
-                      m.original_title = coalesce(row.original_title, "None"),
-                      m.adult = CASE 
-                                    WHEN toInteger(row.adult) = 1 THEN 'Yes' 
-                                    ELSE 'No' 
-                                END,
-                      m.budget = toInteger(coalesce(row.budget, 0)),
-                      m.original_language = coalesce(row.original_language, "None"),
-                      m.revenue = toInteger(coalesce(row.revenue, 0)),
-                      m.tagline = coalesce(row.tagline, "None"),
-                      m.overview = coalesce(row.overview, "None"),
-                      m.release_date = coalesce(row.release_date, "None"),
-                      m.runtime = toFloat(coalesce(row.runtime, 0)),
-                      m.belongs_to_collection = coalesce(row.belongs_to_collection, "None");
+        SET m.title = coalesce(row.title, "None"),
+            m.original_title = coalesce(row.original_title, "None"),
+            m.adult = CASE 
+                          WHEN toInteger(row.adult) = 1 THEN 'Yes' 
+                          ELSE 'No' 
+                      END,
+            m.budget = toInteger(coalesce(row.budget, 0)),
+            m.original_language = coalesce(row.original_language, "None"),
+            m.revenue = toInteger(coalesce(row.revenue, 0)),
+            m.tagline = coalesce(row.tagline, "None"),
+            m.overview = coalesce(row.overview, "None"),
+            m.release_date = coalesce(row.release_date, "None"),
+            m.runtime = toFloat(coalesce(row.runtime, 0)),
+            m.belongs_to_collection = coalesce(row.belongs_to_collection, "None");
         """
-        with self.driver.session() as session:
-            session.run(query, csvFile=f'{csv_file}')
-            print(f"Movies loaded from {csv_file} (limited to {limit} entries)")
+        self._run_load(csv_file, query, limit=limit, row_filter=has_integer_tmdb_id)
+        print(f"Movies loaded from {csv_file} (limited to {limit} entries)")
 
     def load_genres(self, csv_file):
         query = """
-        LOAD CSV WITH HEADERS FROM $csvFile AS row
         MATCH (m:Movie {tmdbId: toInteger(row.tmdbId)})  // Check if the movie exists
         WITH m, row
         MERGE (g:Genre {genre_id: toInteger(row.genre_id)})
-        ON CREATE SET g.genre_name = row.genre_name
+        SET g.genre_name = row.genre_name
         MERGE (m)-[:HAS_GENRE]->(g);
         """
-        with self.driver.session() as session:
-            session.run(query, csvFile=f'{csv_file}')
-            print(f"Genres and relationships to movies loaded from {csv_file}")
+        self._run_load(csv_file, query)
+        print(f"Genres and relationships to movies loaded from {csv_file}")
 
     def load_production_companies(self, csv_file):
         query = """
-        LOAD CSV WITH HEADERS FROM $csvFile AS row
         MATCH (m:Movie {tmdbId: toInteger(row.tmdbId)})  // Check if the movie exists
         WITH m, row
         MERGE (pc:ProductionCompany {company_id: toInteger(row.company_id)})
-        ON CREATE SET pc.company_name = row.company_name
+        SET pc.company_name = row.company_name
         MERGE (m)-[:PRODUCED_BY]->(pc);
         """
-        with self.driver.session() as session:
-            session.run(query, csvFile=f'{csv_file}')
-            print(f"Production companies and relationships to movies loaded from {csv_file}")
+        self._run_load(csv_file, query)
+        print(f"Production companies and relationships to movies loaded from {csv_file}")
 
     def load_production_countries(self, csv_file):
         query = """
-        LOAD CSV WITH HEADERS FROM $csvFile AS row
         MATCH (m:Movie {tmdbId: toInteger(row.tmdbId)})  // Check if the movie exists
         WITH m, row
         MERGE (c:Country {country_code: row.country_code})
-        ON CREATE SET c.country_name = row.country_name
+        SET c.country_name = row.country_name
         MERGE (m)-[:PRODUCED_IN]->(c);
         """
-        with self.driver.session() as session:
-            session.run(query, csvFile=f'{csv_file}')
-            print(f"Production countries and relationships to movies loaded from {csv_file}")
+        self._run_load(csv_file, query)
+        print(f"Production countries and relationships to movies loaded from {csv_file}")
 
     def load_spoken_languages(self, csv_file):
         query = """
-        LOAD CSV WITH HEADERS FROM $csvFile AS row
         MATCH (m:Movie {tmdbId: toInteger(row.tmdbId)})  // Check if the movie exists
         WITH m, row
         MERGE (l:SpokenLanguage {language_code: row.language_code})
-        ON CREATE SET l.language_name = row.language_name
+        SET l.language_name = row.language_name
         MERGE (m)-[:HAS_LANGUAGE]->(l);
         """
-        with self.driver.session() as session:
-            session.run(query, csvFile=f'{csv_file}')
-            print(f"Spoken languages and relationships to movies loaded from {csv_file}")
+        self._run_load(csv_file, query)
+        print(f"Spoken languages and relationships to movies loaded from {csv_file}")
 
     def load_keywords(self, csv_file):
+        # Each keyword becomes a Keyword node so lookups go through the
+        # unique_keyword_name and keyword_names indexes instead of a string scan
         query = """
-        LOAD CSV WITH HEADERS FROM $csvFile AS row
         MATCH (m:Movie {tmdbId: toInteger(row.tmdbId)})  // Check if the movie exists
-        SET m.keywords = row.keywords;
+        UNWIND [keyword IN split(row.keywords, ', ') WHERE trim(keyword) <> ''] AS keyword
+        MERGE (k:Keyword {name: keyword})
+        MERGE (m)-[:HAS_KEYWORD]->(k);
         """
-        with self.driver.session() as session:
-            session.run(query, csvFile=f'{csv_file}')
-            print(f"Keywords loaded from {csv_file}")
+        self._run_load(csv_file, query, in_transactions=True)
+        print(f"Keywords loaded from {csv_file}")
+
+    def load_movie_keywords(self, csv_file):
+        # Local loads read one (tmdbId, keyword_id) row per relationship and
+        # look the keyword name up in the vocabulary here, so nothing has to
+        # be split in Cypher. keyword_id is SET on every load so delta builds
+        # can match the relationships of a row again.
+        vocabulary_file = self.data_file(KEYWORD_VOCABULARY_FILE)
+        names = {str(row['keyword_id']): row['keyword'] for row in iter_rows(vocabulary_file)}
+
+        def add_name(row):
+            return {**row, 'keyword': names[str(row['keyword_id'])]}
+
+        query = """
+        MATCH (m:Movie {tmdbId: toInteger(row.tmdbId)})  // Check if the movie exists
+        MERGE (k:Keyword {name: row.keyword})
+        SET k.keyword_id = toInteger(row.keyword_id)
+        MERGE (m)-[:HAS_KEYWORD]->(k);
+        """
+        self._run_load(csv_file, query, row_map=add_name)
+        print(f"Keywords loaded from {csv_file}")
 
     def load_person_actors(self, csv_file):
         query1 = """
-        LOAD CSV WITH HEADERS FROM $csvFile AS row
-        CALL (row){
         MATCH (m:Movie {tmdbId: toInteger(row.tmdbId)})  // Check if the movie exists
         WITH m, row
         MERGE (p:Person {actor_id: toInteger(row.actor_id)})
-        ON CREATE SET p.name = row.name, p.role= 'actor'
+        ON CREATE SET p.role= 'actor', p:Actor
+        SET p.name = row.name
         MERGE (p)-[a:ACTED_IN]->(m)
         ON CREATE SET a.character = coalesce(row.character, "None"), a.cast_id= toInteger(row.cast_id)
-        }IN TRANSACTIONS OF 50000 ROWS;
         """
-        with self.driver.session() as session:
-            session.run(query1, csvFile=f'{csv_file}')
-            print(f"Actors loaded from {csv_file}")
-        query2 = """
-        MATCH (n:Person) WHERE n.role="actor" SET n:Actor
-        """
-        with self.driver.session() as session:
-            session.run(query2)
-            print(f"Actor label created additionally")
+        self._run_load(csv_file, query1, in_transactions=True)
+        print(f"Actors loaded from {csv_file}")
 
     def load_person_crew(self, csv_file):
-        query1 = """
-        LOAD CSV WITH HEADERS FROM $csvFile AS row
-        MATCH (m:Movie {tmdbId: toInteger(row.tmdbId)})  // Check if the movie exists
-        MERGE (p:Person {crew_id: toInteger(row.crew_id)})
-        ON CREATE SET p.name = row.name, p.role = row.job
-        WITH p, m, row,
-        CASE
-        WHEN row.job='Director' THEN "DIRECTED"
-        WHEN row.job='Producer' THEN "PRODUCED"
-        ELSE "Unknown"
-        END AS crew_rel
-        CALL apoc.create.relationship(p, crew_rel, {}, m)
-        YIELD rel
-        RETURN rel;
-        """
-        with self.driver.session() as session:
-            session.run(query1, csvFile=f'{csv_file}')
-            print(f"Directors and Producers loaded from {csv_file}")
-        query2 = """
-        MATCH (n:Person) WHERE n.role="Director" SET n:Director
-        """
-        with self.driver.session() as session:
-            session.run(query2)
-            print(f"Director label created additionally")
-        query3 = """
-        MATCH (n:Person) WHERE n.role="Producer" SET n:Producer
-        """
-        with self.driver.session() as session:
-            session.run(query3)
-            print(f"Producer label created additionally")
+        # One pass per job so the relationship type is part of the query text
+        # instead of being created row by row through APOC
+        for job, rel_type in CREW_RELATIONSHIPS.items():
+            query = f"""
+            MATCH (m:Movie {{tmdbId: toInteger(row.tmdbId)}})  // Check if the movie exists
+            WHERE row.job = '{job}'
+            MERGE (p:Person {{crew_id: toInteger(row.crew_id)}})
+            ON CREATE SET p.role = row.job
+            SET p.name = row.name
+            FOREACH (_ IN CASE WHEN p.role = 'Director' THEN [1] ELSE [] END | SET p:Director)
+            FOREACH (_ IN CASE WHEN p.role = 'Producer' THEN [1] ELSE [] END | SET p:Producer)
+            MERGE (p)-[:{rel_type}]->(m);
+            """
+            self._run_load(csv_file, query, in_transactions=True,
+                           row_filter=lambda row, job=job: row['job'] == job,
+                           progress_key=f'{csv_file}#{rel_type}')
+        print(f"Directors and Producers loaded from {csv_file}")
 
 
     def load_links(self, csv_file):
         query = """
-        LOAD CSV WITH HEADERS FROM $csvFile AS row
         MATCH (m:Movie {tmdbId: toInteger(row.tmdbId)})  // Check if the movie exists
         SET m.movieId = toInteger(row.movieId),
             m.imdbId = row.imdbId;
         """
-        with self.driver.session() as session:
-            session.run(query, csvFile=f'{csv_file}')
-            print(f"Links loaded from {csv_file}")
+        self._run_load(csv_file, query)
+        print(f"Links loaded from {csv_file}")
 
 
     def load_ratings(self, csv_file):
         query1 = """
-        LOAD CSV WITH HEADERS FROM $csvFile AS row
-        CALL (row){
         MATCH (m:Movie {movieId: toInteger(row.movieId)})  // Check if the movie exists
         WITH m, row
         MERGE (p:Person {user_id: toInteger(row.userId)})
-        ON CREATE SET p.role= 'user'
+        ON CREATE SET p.role= 'user', p:User
         MERGE (p)-[r:RATED]->(m)
         ON CREATE SET r.rating = toFloat(row.rating), r.timestamp = toInteger(row.timestamp)
-        }IN TRANSACTIONS OF 50000 ROWS;
         """
-        with self.driver.session() as session:
-            session.run(query1, csvFile=f'{csv_file}')
-            print(f"Ratings loaded from {csv_file}")
-        query2 = """
-        MATCH (n:Person) WHERE n.role="user" SET n:User
+        self._run_load(csv_file, query1, in_transactions=True)
+        print(f"Ratings loaded from {csv_file}")
+
+    def backfill_person_labels(self):
+        """Add missing Actor/Director/Producer/User labels.
+
+        The loaders set these labels when they create a Person, so this only
+        finds nodes from older builds. It goes through the person_role index
+        and labels in batches instead of sweeping every Person at once.
         """
+        start = time.perf_counter()
+        labels_added = 0
         with self.driver.session() as session:
-            session.run(query2)
-            print(f"User label created additionally")
+            for role, label in PERSON_ROLE_LABELS.items():
+                query = f"""
+                MATCH (n:Person) WHERE n.role = $role AND NOT n:{label}
+                CALL (n) {{
+                SET n:{label}
+                }} IN TRANSACTIONS OF 10000 ROWS
+                """
+                _, summary = _run_autocommit(session, query, role=role)
+                self._record(summary=summary)
+                labels_added += summary.counters.labels_added
+        elapsed = time.perf_counter() - start
+        print(f"Person label backfill added {labels_added} labels in {elapsed:.2f}s "
+              f"(labels are now set at creation, replacing the full Person sweeps)")
 
 
 
@@ -227,26 +737,63 @@ def main():
     user = os.getenv('NEO4J_USERNAME')
     password = os.getenv('NEO4J_PASSWORD')
 
-    graph = CreateGraph(uri, user, password)
-
-    graph.db_cleanup()
-    graph.create_constraints_indexes()
+    checkpoint = BuildCheckpoint(CHECKPOINT_FILE)
+    report = BuildReport(config={'build_mode': BUILD_MODE, 'load_mode': LOAD_MODE,
+                                 'batch_size': LOAD_BATCH_SIZE, 'workers': LOAD_WORKERS})
+    graph = CreateGraph(uri, user, password, mode=LOAD_MODE, batch_size=LOAD_BATCH_SIZE, checkpoint=checkpoint,
+                        report=report)
 
     # Load data from CSV files with a limit on entries for movies
     movie_limit = 10000  # Limit only applied to movies
-    graph.load_movies('https://storage.googleapis.com/movies-packt/normalized_movies.csv', movie_limit)
-
-    # Load related nodes and create relationships conditionally
-    graph.load_genres('https://storage.googleapis.com/movies-packt/normalized_genres.csv')
-    graph.load_production_companies('https://storage.googleapis.com/movies-packt/normalized_production_companies.csv')
-    graph.load_production_countries('https://storage.googleapis.com/movies-packt/normalized_production_countries.csv')
-    graph.load_spoken_languages('https://storage.googleapis.com/movies-packt/normalized_spoken_languages.csv')
-    graph.load_keywords('https://storage.googleapis.com/movies-packt/normalized_keywords.csv')
-    graph.load_person_actors('https://storage.googleapis.com/movies-packt/normalized_cast.csv')
-    graph.load_person_crew('https://storage.googleapis.com/movies-packt/normalized_crew.csv')
-    graph.load_links('https://storage.googleapis.com/movies-packt/normalized_links.csv')
-    graph.load_ratings('https://storage.googleapis.com/movies-packt/normalized_ratings_small.csv')
 
+    if BUILD_MODE == 'schema':
+        graph.create_constraints_indexes()
+        graph.close()
+        return
+
+    if BUILD_MODE == 'delta':
+        if graph.mode != 'local':
+            raise ValueError("Delta builds read the normalized files locally, set GRAPH_LOAD_MODE=local")
+        with report.step('constraints_indexes'):
+            graph.create_constraints_indexes()
+        with report.step('delta_prepare'):
+            manifest = graph.prepare_delta(load_manifest(MANIFEST_FILE), movie_limit)
+    else:
+        # Offsets of an interrupted delta build count delta rows, so only the
+        # progress of a full build is resumed
+        if checkpoint.start('full'):
+            print("Discarded the checkpoint of a different build")
+        # Only start from a blank database when there is no interrupted build to resume
+        if checkpoint.has_progress():
+            print(f"Resuming interrupted build from {CHECKPOINT_FILE}")
+        else:
+            # The manifest no longer describes the graph; until this build
+            # saves a new one, a delta build reloads every row
+            if os.path.exists(MANIFEST_FILE):
+                os.remove(MANIFEST_FILE)
+            with report.step('cleanup'):
+                graph.db_cleanup(batch_size=CLEANUP_BATCH_SIZE, drop_schema=CLEANUP_DROP_SCHEMA,
+                                 drop_database=CLEANUP_DROP_DATABASE)
+        with report.step('constraints_indexes'):
+            graph.create_constraints_indexes()
+        # Remote files cannot be hashed, so only local builds leave a manifest
+        manifest = graph.snapshot_rows(movie_limit) if graph.mode == 'local' else None
+
+    # Load related nodes and create relationships conditionally, running
+    # independent steps in parallel
+    run_load_plan(graph.load_steps(movie_limit), max_workers=LOAD_WORKERS, checkpoint=checkpoint, report=report)
+
+    # The build finished, so the next run starts from scratch again
+    checkpoint.clear()
+    if manifest is not None:
+        save_manifest(MANIFEST_FILE, manifest)
+
+    previous = load_report(REPORT_BASELINE)
+    current = report.to_dict()
+    report.save(REPORT_FILE)
+    print(f"Build report written to {REPORT_FILE}")
+    if previous is not None:
+        compare_reports(previous, current)
 
     graph.close()
 
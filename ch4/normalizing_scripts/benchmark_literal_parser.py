@@ -0,0 +1,58 @@
+import ast
+import time
+import pandas as pd
+from literal_parser import parse_records, parse_rows
+
+# Compares ast.literal_eval with the literal_parser function each normalizer
+# calls (parse_rows for credits and keywords, parse_records for
+# movies_metadata) on the real raw files. Run it from the ch4 directory, like
+# the normalizing scripts.
+
+# (raw file, column, keys the normalizers keep, parser they use)
+COLUMNS = [
+    ('./raw_data/credits.csv', 'cast', ('id', 'name', 'character', 'cast_id'), parse_rows),
+    ('./raw_data/credits.csv', 'crew', ('id', 'name', 'job'), parse_rows),
+    ('./raw_data/keywords.csv', 'keywords', ('id', 'name'), parse_rows),
+    ('./raw_data/movies_metadata.csv', 'genres', ('id', 'name'), parse_records),
+    ('./raw_data/movies_metadata.csv', 'production_companies', ('id', 'name'), parse_records),
+    ('./raw_data/movies_metadata.csv', 'production_countries', ('iso_3166_1', 'name'), parse_records),
+    ('./raw_data/movies_metadata.csv', 'spoken_languages', ('iso_639_1', 'name'), parse_records),
+]
+
+
+# The same output as parse_records or parse_rows, built with literal_eval
+def with_literal_eval(parser):
+    def parse(cell, keys):
+        value = ast.literal_eval(cell)
+        if not isinstance(value, list):
+            return []
+        if parser is parse_rows:
+            return [[item.get(key) for key in keys] for item in value]
+        return [{key: item[key] for key in keys if key in item} for item in value]
+    return parse
+
+
+def time_column(cells, keys, parse):
+    start = time.perf_counter()
+    parsed = [parse(cell, keys) for cell in cells]
+    return time.perf_counter() - start, parsed
+
+
+def main():
+    frames = {}
+    for csv_file, column, keys, parser in COLUMNS:
+        if csv_file not in frames:
+            frames[csv_file] = pd.read_csv(csv_file, low_memory=False)
+        cells = [cell for cell in frames[csv_file][column] if isinstance(cell, str)]
+        mb = sum(len(cell) for cell in cells) / 1e6
+
+        baseline_time, expected = time_column(cells, keys, with_literal_eval(parser))
+        parser_time, parsed = time_column(cells, keys, parser)
+        status = "identical" if parsed == expected else "MISMATCH"
+        print(f"{column:<22} {len(cells):>7} cells {mb:7.1f} MB  "
+              f"literal_eval {baseline_time:6.2f}s  {parser.__name__:<13} {parser_time:6.2f}s  "
+              f"{baseline_time / parser_time:4.1f}x  {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import ast
+import re
+
+# The raw Kaggle files store lists of dicts as Python literals, for example
+# "[{'id': 16, 'name': 'Animation'}, ...]". ast.literal_eval builds a full
+# syntax tree for every cell, which is slow on cast strings tens of KB long.
+# These helpers only accept flat dicts of scalars, which is all these columns
+# contain: the whole cell is first checked against a regular expression of
+# that grammar, then the key/value pairs are pulled out in one findall pass
+# and only the requested keys are kept. Anything else goes to literal_eval.
+
+_VALUE = r"""(?:'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|None|True|False)"""
+_PAIR = rf"""'[^'\\]*'\s*:\s*{_VALUE}"""
+_DICT = rf"""\{{\s*(?:{_PAIR}(?:\s*,\s*{_PAIR})*)?\s*\}}"""
+_LIST_OF_DICTS = re.compile(rf"""\s*\[\s*(?:{_DICT}(?:\s*,\s*{_DICT})*)?\s*\]\s*""")
+_SINGLE_DICT = re.compile(rf"""\s*{_DICT}\s*""")
+
+# Once the grammar has matched, every match of _TOKEN is either the start of a
+# dict or one complete key/value pair, so no match can begin inside a string
+_TOKEN = re.compile(r"""
+    (\{)
+  | '([^'\\]*)'\s*:\s*
+    (?:
+        ('(?:[^'\\]|\\.)*')
+      | ("(?:[^"\\]|\\.)*")
+      | (-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+      | (None|True|False)
+    )
+""", re.VERBOSE)
+_CONSTANTS = {'None': None, 'True': True, 'False': False}
+
+
+def _decode(quoted, number, constant):
+    if quoted:
+        if '\\' in quoted:
+            return ast.literal_eval(quoted)
+        return quoted[1:-1]
+    if number:
+        if '.' in number or 'e' in number or 'E' in number:
+            return float(number)
+        return int(number)
+    return _CONSTANTS[constant]
+
+
+def _extract(text, keys):
+    records = []
+    record = None
+    for brace, key, single, double, number, constant in _TOKEN.findall(text):
+        if brace:
+            record = {}
+            records.append(record)
+        elif key in keys:
+            record[key] = _decode(single or double, number, constant)
+    return records
+
+
+def _extract_rows(text, keys):
+    index = {key: position for position, key in enumerate(keys)}
+    rows = []
+    row = None
+    for brace, key, single, double, number, constant in _TOKEN.findall(text):
+        if brace:
+            row = [None] * len(keys)
+            rows.append(row)
+        elif key in index:
+            row[index[key]] = _decode(single or double, number, constant)
+    return rows
+
+
+def _select(value, keys):
+    return {key: value[key] for key in keys if key in value}
+
+
+def parse_records(text, keys):
+    """Parse a stringified list of dicts, keeping only the given keys.
+
+    Falls back to ast.literal_eval when the text is not a plain list of flat
+    dicts; a literal that is not a list gives an empty list.
+    """
+    keys = frozenset(keys)
+    if _LIST_OF_DICTS.fullmatch(text):
+        return _extract(text, keys)
+    value = ast.literal_eval(text)
+    if not isinstance(value, list):
+        return []
+    return [_select(item, keys) for item in value]
+
+
+def parse_rows(text, keys):
+    """Parse a stringified list of dicts into rows of the given keys' values.
+
+    Like parse_records, but each record is a list of values in the order of
+    keys (None for a missing key) instead of a dict.
+    """
+    if _LIST_OF_DICTS.fullmatch(text):
+        return _extract_rows(text, keys)
+    value = ast.literal_eval(text)
+    if not isinstance(value, list):
+        return []
+    return [[item.get(key) for key in keys] for item in value]
+
+
+def parse_record(text, keys):
+    """Parse a single stringified dict, keeping only the given keys.
+
+    Returns None when the literal is not a dict.
+    """
+    keys = frozenset(keys)
+    if _SINGLE_DICT.fullmatch(text):
+        return _extract(text, keys)[0]
+    value = ast.literal_eval(text)
+    if not isinstance(value, dict):
+        return None
+    return _select(value, keys)
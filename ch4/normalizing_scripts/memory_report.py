@@ -0,0 +1,78 @@
+import os
+import sys
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# The normalizing scripts print a memory line after each stage: the peak
+# resident set size of the main process so far, the resident set size the
+# live worker processes hold right now (parallel_normalize.py parses in a
+# process pool, and the container's memory limit counts those too), the peak
+# of the largest child process that already exited, and the deep
+# memory_usage() of the DataFrames alive at that point. Turn it off with
+# NORMALIZE_MEMORY_REPORT=false.
+ENABLED = os.getenv('NORMALIZE_MEMORY_REPORT', 'true').lower() == 'true'
+
+MB = 1024 * 1024
+
+
+def peak_rss_mb(who='self'):
+    """Peak RSS of this process, or with who='children' of its largest exited child."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if who == 'children' else resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / MB if sys.platform == 'darwin' else peak / 1024
+
+
+def workers_rss_mb():
+    """Return (current RSS summed over the live descendant processes, their count).
+
+    Read from /proc, so (None, 0) where there is none.
+    """
+    parents = {}
+    try:
+        pids = [int(name) for name in os.listdir('/proc') if name.isdigit()]
+    except FileNotFoundError:
+        return None, 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat', encoding='utf-8') as f:
+                # The command name may hold spaces, the parent pid follows it
+                parents[pid] = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    workers, frontier = set(), {os.getpid()}
+    while frontier:
+        frontier = {pid for pid, parent in parents.items() if parent in frontier} - workers
+        workers |= frontier
+    rss = 0
+    for pid in workers:
+        try:
+            with open(f'/proc/{pid}/statm', encoding='utf-8') as f:
+                rss += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, IndexError, ValueError):
+            continue
+    return rss / MB, len(workers)
+
+
+def frame_mb(df):
+    return df.memory_usage(deep=True).sum() / MB
+
+
+def report_memory(script, stage, **frames):
+    """Print the RSS figures and the size of each named DataFrame after a stage."""
+    if not ENABLED:
+        return
+    peak = peak_rss_mb()
+    parts = [f"main process peak RSS {peak:.0f} MB" if peak is not None else "main process peak RSS n/a"]
+    rss, workers = workers_rss_mb()
+    if workers:
+        parts.append(f"{workers} worker processes RSS {rss:.0f} MB now")
+    finished_peak = peak_rss_mb('children')
+    if finished_peak:
+        parts.append(f"largest exited child peak RSS {finished_peak:.0f} MB")
+    parts += [f"{name} {frame_mb(df):.1f} MB" for name, df in frames.items() if df is not None]
+    print(f"[memory] {script} {stage}: " + ", ".join(parts))
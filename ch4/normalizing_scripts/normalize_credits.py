@@ -1,57 +1,97 @@
 import pandas as pd
-import ast
 import os
+from literal_parser import parse_rows
+from parallel_apply import ordered_map
+from table_writer import TableWriter
+from memory_report import report_memory
 
-# Ensure the output directory exists
-output_dir = "normalized_data"
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
+# credits.csv is processed this many rows at a time and the results are
+# appended to the output files, so peak memory does not grow with the input.
+# 0 processes the whole file in one go.
+CHUNK_SIZE = int(os.getenv('NORMALIZE_CHUNK_SIZE', '5000'))
 
-# Load the CSV file
-df = pd.read_csv('./raw_data/credits.csv')
+# Columns of the output files, and the keys read from the raw dicts for them
+cast_columns = ['actor_id', 'name', 'character', 'cast_id', 'tmdbId']
+crew_columns = ['crew_id', 'name', 'job', 'tmdbId']
+cast_keys = ('id', 'name', 'character', 'cast_id')
+crew_keys = ('id', 'name', 'job')
+relevant_jobs = {'Director', 'Producer'}
+# Compact dtypes of the raw and output frames
+raw_dtypes = {'id': 'int32'}
+cast_dtypes = {'actor_id': 'int32', 'cast_id': 'int32', 'tmdbId': 'int32'}
+crew_dtypes = {'crew_id': 'int32', 'job': 'category', 'tmdbId': 'int32'}
 
-# Function to extract relevant cast information
-def extract_cast(cast_str):
-    cast_list = ast.literal_eval(cast_str)
-    return [{'actor_id': c['id'], 'name': c['name'], 'character': c['character'], 'cast_id': c['cast_id']} for c in cast_list]
+# Drop rows already written by an earlier chunk (or earlier in this chunk).
+# Rows are compared on all their columns, tmdbId included, and only 64-bit
+# row hashes are remembered, not the rows themselves.
+def drop_seen(df, seen):
+    hashes = pd.util.hash_pandas_object(df, index=False)
+    keep = ~hashes.duplicated() & ~hashes.isin(seen)
+    seen.update(hashes[keep].tolist())
+    return df[keep]
 
-# Function to extract relevant crew information
-def extract_crew(crew_str):
-    crew_list = ast.literal_eval(crew_str)
-    relevant_jobs = ['Director', 'Producer']
-    return [{'crew_id': c['id'], 'name': c['name'], 'job': c['job']} for c in crew_list if c['job'] in relevant_jobs]
+# Append the parsed rows of one movie to the output column lists. The parsed
+# values fill the columns before tmdbId, which is always the last one.
+def extend_columns(columns, rows, movie_id):
+    if rows:
+        for values, column in zip(zip(*rows), columns.values()):
+            column.extend(values)
+        columns['tmdbId'].extend([movie_id] * len(rows))
 
-# Apply the extraction functions to each row
-df['cast'] = df['cast'].apply(extract_cast)
-df['crew'] = df['crew'].apply(extract_crew)
+# Parse one chunk of credits.csv straight into cast and crew column lists,
+# with the movie ID carried on every row. Runs in a worker process when an
+# executor is given.
+def normalize_chunk(df):
+    cast = {column: [] for column in cast_columns}
+    crew = {column: [] for column in crew_columns}
+    for movie_id, cast_str, crew_str in zip(df['id'], df['cast'], df['crew']):
+        extend_columns(cast, parse_rows(cast_str, cast_keys), movie_id)
+        crew_rows = [row for row in parse_rows(crew_str, crew_keys) if row[2] in relevant_jobs]
+        extend_columns(crew, crew_rows, movie_id)
+    df_cast_normalized = pd.DataFrame(cast).astype(cast_dtypes) if cast['tmdbId'] else None
+    df_crew_normalized = pd.DataFrame(crew).astype(crew_dtypes) if crew['tmdbId'] else None
+    return df_cast_normalized, df_crew_normalized
 
-# Explode the lists into separate rows
-df_cast = df.explode('cast').dropna(subset=['cast'])
-df_crew = df.explode('crew').dropna(subset=['crew'])
+def main(executor=None, max_pending=8):
+    # Ensure the output directory exists
+    output_dir = "normalized_data"
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
 
-# Normalize the exploded data
-df_cast_normalized = pd.json_normalize(df_cast['cast'])
-df_crew_normalized = pd.json_normalize(df_crew['crew'])
+    cast_writer = TableWriter(output_dir, 'normalized_cast')
+    crew_writer = TableWriter(output_dir, 'normalized_crew')
 
-# Reset index to avoid duplicate indices
-df_cast_normalized = df_cast_normalized.reset_index(drop=True)
-df_crew_normalized = df_crew_normalized.reset_index(drop=True)
+    seen_cast, seen_crew = set(), set()
+    sample_cast, sample_crew = None, None
 
-# Drop duplicate rows if any
-df_cast_normalized = df_cast_normalized.drop_duplicates()
-df_crew_normalized = df_crew_normalized.drop_duplicates()
+    chunks = pd.read_csv('./raw_data/credits.csv', chunksize=CHUNK_SIZE, dtype=raw_dtypes) if CHUNK_SIZE else [pd.read_csv('./raw_data/credits.csv', dtype=raw_dtypes)]
+    # Chunks are normalized in parallel but written strictly in file order
+    results = map(normalize_chunk, chunks) if executor is None else ordered_map(executor, normalize_chunk, chunks, max_pending)
+    for df_cast_normalized, df_crew_normalized in results:
+        # Drop duplicate rows across all chunks and append
+        if df_cast_normalized is not None:
+            df_cast_normalized = drop_seen(df_cast_normalized, seen_cast)
+            cast_writer.write(df_cast_normalized)
+            if sample_cast is None:
+                sample_cast = df_cast_normalized.head()
+                report_memory('normalize_credits', 'first chunk', cast=df_cast_normalized)
 
-# Add the movie ID back to the normalized DataFrames
-df_cast_normalized['tmdbId'] = df_cast.reset_index(drop=True)['id']
-df_crew_normalized['tmdbId'] = df_crew.reset_index(drop=True)['id']
+        if df_crew_normalized is not None:
+            df_crew_normalized = drop_seen(df_crew_normalized, seen_crew)
+            crew_writer.write(df_crew_normalized)
+            if sample_crew is None:
+                sample_crew = df_crew_normalized.head()
 
-# Save the normalized data with the updated column names
-df_cast_normalized.to_csv(os.path.join(output_dir, 'normalized_cast.csv'), index=False)
-df_crew_normalized.to_csv(os.path.join(output_dir, 'normalized_crew.csv'), index=False)
+    cast_writer.close()
+    crew_writer.close()
+    report_memory('normalize_credits', 'written')
 
-# Display a sample of the output for verification
-print("Sample of normalized cast data:")
-print(df_cast_normalized.head())
+    # Display a sample of the output for verification
+    print("Sample of normalized cast data:")
+    print(sample_cast)
 
-print("Sample of normalized crew data:")
-print(df_crew_normalized.head())
+    print("Sample of normalized crew data:")
+    print(sample_crew)
+
+if __name__ == "__main__":
+    main()
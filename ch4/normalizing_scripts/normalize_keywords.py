@@ -1,35 +1,86 @@
 import pandas as pd
-import ast
 import os
+from literal_parser import parse_rows
+from parallel_apply import apply_columns
+from table_writer import write_table
+from memory_report import report_memory
 
-# Ensure the output directory exists
-output_dir = "normalized_data"
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
-
-# Load the CSV file
-df = pd.read_csv('./raw_data/keywords.csv')  # Update the path as necessary
-
-# Function to extract and normalize keywords
+# Function to extract the (keyword_id, name) pairs of a movie
 def normalize_keywords(keyword_str):
     if pd.isna(keyword_str) or not isinstance(keyword_str, str):  # Check if the value is NaN or not a string
         return []
-    # Convert the stringified JSON object into a list of dictionaries
-    keyword_list = ast.literal_eval(keyword_str)
-    # Extract the 'name' of each keyword and return them as a list
-    return [kw['name'] for kw in keyword_list]
+    # Convert the stringified JSON object into [id, name] rows
+    return parse_rows(keyword_str, ('id', 'name'))
+
+# Gives each keyword name one integer ID. TMDB's own keyword ID is kept, so IDs
+# stay the same from one run to the next; a name without an ID, or whose ID
+# already belongs to another name, gets the next unused one.
+class KeywordVocabulary:
+    def __init__(self):
+        self.ids = {}  # name -> keyword_id, in first-seen order
+        self.used = set()
+        self.next_id = 1
+
+    def id_for(self, name, keyword_id):
+        if name in self.ids:
+            return self.ids[name]
+        if keyword_id is None or keyword_id in self.used:
+            while self.next_id in self.used:
+                self.next_id += 1
+            keyword_id = self.next_id
+        self.ids[name] = keyword_id
+        self.used.add(keyword_id)
+        return keyword_id
+
+def main(executor=None):
+    # Ensure the output directory exists
+    output_dir = "normalized_data"
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # Load the CSV file
+    df = pd.read_csv('./raw_data/keywords.csv', dtype={'id': 'int32'})  # Update the path as necessary
+    report_memory('normalize_keywords', 'read', keywords=df)
+
+    # Apply the normalization function to the 'keywords' column
+    apply_columns(df, {'keywords': normalize_keywords}, executor)
+
+    # Walk the movies once, collecting each movie's keyword names, the keyword
+    # vocabulary and the (tmdbId, keyword_id) pairs. Lists are extended in
+    # place, so this stays linear in the number of keywords.
+    movie_keywords = {}
+    vocabulary = KeywordVocabulary()
+    movie_keyword_ids = {}  # Insertion-ordered set of (tmdbId, keyword_id)
+    for movie_id, keywords in zip(df['id'], df['keywords']):
+        names = movie_keywords.setdefault(movie_id, [])
+        for keyword_id, name in keywords:
+            names.append(name)
+            movie_keyword_ids[(movie_id, vocabulary.id_for(name, keyword_id))] = None
+
+    # Combine all keywords for each tmdbId into a single row, kept for the
+    # remote LOAD CSV build
+    df_keywords_aggregated = pd.DataFrame({
+        'tmdbId': sorted(movie_keywords),
+        'keywords': [', '.join(movie_keywords[movie_id]) for movie_id in sorted(movie_keywords)],
+    })
+    df_vocabulary = pd.DataFrame({'keyword_id': list(vocabulary.ids.values()), 'keyword': list(vocabulary.ids)}).astype({'keyword_id': 'int32'})
+    df_movie_keywords = pd.DataFrame(list(movie_keyword_ids), columns=['tmdbId', 'keyword_id']).astype('int32')
+    report_memory('normalize_keywords', 'aggregated', keywords=df, keywords_aggregated=df_keywords_aggregated,
+                  vocabulary=df_vocabulary, movie_keywords=df_movie_keywords)
 
-# Apply the normalization function to the 'keywords' column
-df['keywords'] = df['keywords'].apply(normalize_keywords)
+    # Save the aggregated keywords, the vocabulary and the movie -> keyword table
+    write_table(df_keywords_aggregated, output_dir, 'normalized_keywords')
+    write_table(df_vocabulary, output_dir, 'normalized_keyword_vocabulary')
+    write_table(df_movie_keywords, output_dir, 'normalized_movie_keywords')
 
-# Combine all keywords for each tmdbId into a single row
-df_keywords_aggregated = df.groupby('id', as_index=False).agg({'keywords': lambda x: ', '.join(sum(x, []))})
+    # Display the first few rows of the aggregated DataFrame for verification
+    print(df_keywords_aggregated.head())
 
-# Rename the 'id' column to 'tmdbId'
-df_keywords_aggregated.rename(columns={'id': 'tmdbId'}, inplace=True)
+    print("Sample of the keyword vocabulary:")
+    print(df_vocabulary.head())
 
-# Save the aggregated DataFrame to a new CSV file
-df_keywords_aggregated.to_csv(os.path.join(output_dir, 'normalized_keywords.csv'), index=False)
+    print("Sample of movie keywords:")
+    print(df_movie_keywords.head())
 
-# Display the first few rows of the aggregated DataFrame for verification
-print(df_keywords_aggregated.head())
+if __name__ == "__main__":
+    main()
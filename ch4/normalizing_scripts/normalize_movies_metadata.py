@@ -1,28 +1,21 @@
 import pandas as pd
-import ast
 import os
-
-
-# Ensure the output directory exists
-output_dir = "normalized_data"
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
-
-# Load the CSV file
-df = pd.read_csv('./raw_data/movies_metadata.csv')  # Update the path as necessary
+from literal_parser import parse_records, parse_record
+from table_writer import write_table
+from memory_report import report_memory
 
 # Function to extract and normalize genres
 def extract_genres(genres_str):
     if pd.isna(genres_str) or not isinstance(genres_str, str):
         return []
-    genres_list = ast.literal_eval(genres_str)
+    genres_list = parse_records(genres_str, ('id', 'name'))
     return [{'genre_id': int(g['id']), 'genre_name': g['name']} for g in genres_list]
 
 # Function to extract and normalize production companies
 def extract_production_companies(companies_str):
     if pd.isna(companies_str) or not isinstance(companies_str, str):
         return []
-    companies_list = ast.literal_eval(companies_str)
+    companies_list = parse_records(companies_str, ('id', 'name'))
     if isinstance(companies_list, list):
         return [{'company_id': int(c['id']), 'company_name': c['name']} for c in companies_list]
     return []
@@ -31,7 +24,7 @@ def extract_production_companies(companies_str):
 def extract_production_countries(countries_str):
     if pd.isna(countries_str) or not isinstance(countries_str, str):
         return []
-    countries_list = ast.literal_eval(countries_str)
+    countries_list = parse_records(countries_str, ('iso_3166_1', 'name'))
     if isinstance(countries_list, list):
         return [{'country_code': c['iso_3166_1'], 'country_name': c['name']} for c in countries_list]
     return []
@@ -40,84 +33,143 @@ def extract_production_countries(countries_str):
 def extract_spoken_languages(languages_str):
     if pd.isna(languages_str) or not isinstance(languages_str, str):
         return []
-    languages_list = ast.literal_eval(languages_str)
+    languages_list = parse_records(languages_str, ('iso_639_1', 'name'))
     if isinstance(languages_list, list):
         return [{'language_code': l['iso_639_1'], 'language_name': l['name']} for l in languages_list]
     return []
 
-# Apply the extraction functions to each row
-df['genres'] = df['genres'].apply(extract_genres)
-df['production_companies'] = df['production_companies'].apply(extract_production_companies)
-df['production_countries'] = df['production_countries'].apply(extract_production_countries)
-df['spoken_languages'] = df['spoken_languages'].apply(extract_spoken_languages)
-
-# Explode the lists into separate rows
-df_genres = df.explode('genres').dropna(subset=['genres'])
-df_companies = df.explode('production_companies').dropna(subset=['production_companies'])
-df_countries = df.explode('production_countries').dropna(subset=['production_countries'])
-df_languages = df.explode('spoken_languages').dropna(subset=['spoken_languages'])
-
-# Normalize the exploded data
-df_genres_normalized = pd.json_normalize(df_genres['genres'])
-df_companies_normalized = pd.json_normalize(df_companies['production_companies'])
-df_countries_normalized = pd.json_normalize(df_countries['production_countries'])
-df_languages_normalized = pd.json_normalize(df_languages['spoken_languages'])
-
-# Reset index to avoid duplicate indices
-df_genres_normalized = df_genres_normalized.reset_index(drop=True)
-df_companies_normalized = df_companies_normalized.reset_index(drop=True)
-df_countries_normalized = df_countries_normalized.reset_index(drop=True)
-df_languages_normalized = df_languages_normalized.reset_index(drop=True)
-
-# Add the movie ID back to the normalized DataFrames as 'tmdbId'
-df_genres_normalized['tmdbId'] = df_genres.reset_index(drop=True)['id']
-df_companies_normalized['tmdbId'] = df_companies.reset_index(drop=True)['id']
-df_countries_normalized['tmdbId'] = df_countries.reset_index(drop=True)['id']
-df_languages_normalized['tmdbId'] = df_languages.reset_index(drop=True)['id']
-
-# Ensure that 'company_id' and similar fields are treated as integers
-df_companies_normalized['company_id'] = df_companies_normalized['company_id'].astype(int)
-df_genres_normalized['genre_id'] = df_genres_normalized['genre_id'].astype(int)
-
-# Save the normalized data with the updated column names
-df_genres_normalized.to_csv(os.path.join(output_dir, 'normalized_genres.csv'), index=False)
-df_companies_normalized.to_csv(os.path.join(output_dir, 'normalized_production_companies.csv'), index=False)
-df_countries_normalized.to_csv(os.path.join(output_dir, 'normalized_production_countries.csv'), index=False)
-df_languages_normalized.to_csv(os.path.join(output_dir, 'normalized_spoken_languages.csv'), index=False)
-
 # For the movies, including "Belongs to Collection" within the same CSV
 # Extract only the "name" from "belongs_to_collection" and include additional fields
 def extract_collection_name(collection_str):
     if isinstance(collection_str, str):
         try:
-            collection_dict = ast.literal_eval(collection_str)
+            collection_dict = parse_record(collection_str, ('name',))
             if isinstance(collection_dict, dict):
                 return collection_dict.get('name', "None")
         except (ValueError, SyntaxError):  # Handle cases where string parsing fails
             return "None"
     return "None"
 
-df_movies = df[['id', 'original_title', 'adult', 'budget', 'imdb_id', 'original_language', 'revenue', 'tagline', 'title', 'release_date', 'runtime', 'overview', 'belongs_to_collection']].copy()
-
-df_movies['belongs_to_collection'] = df_movies['belongs_to_collection'].apply(extract_collection_name)
-df_movies['adult'] = df_movies['adult'].apply(lambda x: 1 if x == 'TRUE' else 0)  # Convert 'adult' to integer
-df_movies.rename(columns={'id': 'tmdbId'}, inplace=True)  # Rename 'id' to 'tmdbId'
-
-# Save the movies to a separate CSV, including the extracted fields
-df_movies.to_csv('./normalized_data/normalized_movies.csv', index=False)
-
-# Display a sample of the output for verification
-print("Sample of normalized genres data:")
-print(df_genres_normalized.head())
-
-print("Sample of normalized production companies data:")
-print(df_companies_normalized.head())
-
-print("Sample of normalized production countries data:")
-print(df_countries_normalized.head())
-
-print("Sample of normalized spoken languages data:")
-print(df_languages_normalized.head())
-
-print("Sample of movies data:")
-print(df_movies.head())
+# Columns of each normalized table, in output order
+TABLES = {
+    'genres': ['genre_id', 'genre_name', 'tmdbId'],
+    'production_companies': ['company_id', 'company_name', 'tmdbId'],
+    'production_countries': ['country_code', 'country_name', 'tmdbId'],
+    'spoken_languages': ['language_code', 'language_name', 'tmdbId'],
+}
+EXTRACTORS = {
+    'genres': extract_genres,
+    'production_companies': extract_production_companies,
+    'production_countries': extract_production_countries,
+    'spoken_languages': extract_spoken_languages,
+}
+# Compact dtypes of the normalized tables: int32 IDs and categoricals for the
+# small, heavily repeated vocabularies
+TABLE_DTYPES = {
+    'genres': {'genre_id': 'int32', 'genre_name': 'category'},
+    'production_companies': {'company_id': 'int32'},
+    'production_countries': {'country_code': 'category', 'country_name': 'category'},
+    'spoken_languages': {'language_code': 'category', 'language_name': 'category'},
+}
+# Raw columns read as categoricals. id stays text because a few raw rows are
+# malformed and hold dates there.
+RAW_DTYPES = {'adult': 'category', 'original_language': 'category'}
+MOVIE_COLUMNS = ['id', 'original_title', 'adult', 'budget', 'imdb_id', 'original_language', 'revenue', 'tagline', 'title', 'release_date', 'runtime', 'overview', 'belongs_to_collection']
+
+# Rows of movies_metadata.csv walked by one task when an executor is given
+CHUNK_SIZE = 5000
+
+# Walk each row of a chunk once, parsing all nested columns, and append the
+# results to per-table column lists instead of exploding the DataFrame
+def extract_rows(df):
+    buffers = {table: {column: [] for column in columns} for table, columns in TABLES.items()}
+    buffers['movies'] = {'adult': [], 'belongs_to_collection': []}
+    tables = list(EXTRACTORS)
+    for movie_id, adult, collection, *nested in zip(df['id'], df['adult'], df['belongs_to_collection'], *(df[table] for table in tables)):
+        for table, value in zip(tables, nested):
+            buffer = buffers[table]
+            for record in EXTRACTORS[table](value):
+                for column, field in record.items():
+                    buffer[column].append(field)
+                buffer['tmdbId'].append(movie_id)
+        buffers['movies']['adult'].append(1 if adult == 'TRUE' else 0)  # Convert 'adult' to integer
+        buffers['movies']['belongs_to_collection'].append(extract_collection_name(collection))
+    return buffers
+
+# Concatenate the buffers of consecutive chunks, keeping row order
+def merge_buffers(parts):
+    merged = None
+    for buffers in parts:
+        if merged is None:
+            merged = buffers
+            continue
+        for table, columns in buffers.items():
+            for column, values in columns.items():
+                merged[table][column].extend(values)
+    return merged
+
+def main(executor=None):
+    # Ensure the output directory exists
+    output_dir = "normalized_data"
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # Load the CSV file, keeping only the columns that end up in an output file
+    df = pd.read_csv('./raw_data/movies_metadata.csv', usecols=MOVIE_COLUMNS + list(TABLES),
+                     dtype=RAW_DTYPES)  # Update the path as necessary
+    report_memory('normalize_movies_metadata', 'read', movies_metadata=df)
+
+    # Parse every nested column in a single walk over the rows, spreading
+    # chunks of rows over the executor when one is given
+    if executor is None:
+        buffers = extract_rows(df)
+    else:
+        chunks = [df.iloc[start:start + CHUNK_SIZE] for start in range(0, len(df), CHUNK_SIZE)]
+        buffers = merge_buffers(executor.map(extract_rows, chunks)) if chunks else extract_rows(df)
+
+    # Build the normalized DataFrames straight from the column lists, with
+    # integer IDs and categorical names
+    df_genres_normalized = pd.DataFrame(buffers['genres'], columns=TABLES['genres']).astype(TABLE_DTYPES['genres'])
+    df_companies_normalized = pd.DataFrame(buffers['production_companies'], columns=TABLES['production_companies']).astype(TABLE_DTYPES['production_companies'])
+    df_countries_normalized = pd.DataFrame(buffers['production_countries'], columns=TABLES['production_countries']).astype(TABLE_DTYPES['production_countries'])
+    df_languages_normalized = pd.DataFrame(buffers['spoken_languages'], columns=TABLES['spoken_languages']).astype(TABLE_DTYPES['spoken_languages'])
+    report_memory('normalize_movies_metadata', 'parsed', movies_metadata=df, genres=df_genres_normalized,
+                  production_companies=df_companies_normalized, production_countries=df_countries_normalized,
+                  spoken_languages=df_languages_normalized)
+
+    # Save the normalized data with the updated column names
+    write_table(df_genres_normalized, output_dir, 'normalized_genres')
+    write_table(df_companies_normalized, output_dir, 'normalized_production_companies')
+    write_table(df_countries_normalized, output_dir, 'normalized_production_countries')
+    write_table(df_languages_normalized, output_dir, 'normalized_spoken_languages')
+
+    # The nested columns are no longer needed once they have been parsed
+    df_movies = df.drop(columns=list(TABLES))[MOVIE_COLUMNS]
+    del df
+    df_movies['adult'] = pd.array(buffers['movies']['adult'], dtype='int8')
+    df_movies['belongs_to_collection'] = pd.Categorical(buffers['movies']['belongs_to_collection'])
+    del buffers
+    df_movies.rename(columns={'id': 'tmdbId'}, inplace=True)  # Rename 'id' to 'tmdbId'
+
+    # Save the movies to a separate CSV, including the extracted fields
+    write_table(df_movies, output_dir, 'normalized_movies')
+    report_memory('normalize_movies_metadata', 'written', movies=df_movies)
+
+    # Display a sample of the output for verification
+    print("Sample of normalized genres data:")
+    print(df_genres_normalized.head())
+
+    print("Sample of normalized production companies data:")
+    print(df_companies_normalized.head())
+
+    print("Sample of normalized production countries data:")
+    print(df_countries_normalized.head())
+
+    print("Sample of normalized spoken languages data:")
+    print(df_languages_normalized.head())
+
+    print("Sample of movies data:")
+    print(df_movies.head())
+
+if __name__ == "__main__":
+    main()
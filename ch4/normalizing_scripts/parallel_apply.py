@@ -0,0 +1,51 @@
+from collections import deque
+import pandas as pd
+
+# Helpers that let the normalizing scripts spread their parsing over a process
+# pool (see parallel_normalize.py) while producing exactly the serial output.
+
+# Rows of a column parsed by one task
+CHUNK_SIZE = 5000
+
+
+def _apply_chunk(func, chunk):
+    return chunk.apply(func)
+
+
+def apply_columns(df, extractors, executor=None, chunk_size=CHUNK_SIZE):
+    """Replace df[column] with df[column].apply(func) for each column -> func.
+
+    Without an executor this is a plain apply. With one, the chunks of every
+    column are submitted together so different columns are parsed at the same
+    time, and each column is reassembled in its original row order. func must
+    be a module-level function so it can be sent to the worker processes.
+    """
+    if executor is None:
+        for column, func in extractors.items():
+            df[column] = df[column].apply(func)
+        return df
+
+    futures = {
+        column: [executor.submit(_apply_chunk, func, df[column].iloc[start:start + chunk_size])
+                 for start in range(0, len(df), chunk_size)]
+        for column, func in extractors.items()
+    }
+    for column, parts in futures.items():
+        if parts:
+            df[column] = pd.concat([future.result() for future in parts])
+    return df
+
+
+def ordered_map(executor, func, items, max_pending):
+    """Like map(func, items) on an executor, yielding results in input order.
+
+    At most max_pending items are in flight, so a large chunked file is never
+    read into memory all at once.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import hashlib
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import partial
+import normalize_movies_metadata
+import normalize_credits
+import normalize_keywords
+from table_writer import OUTPUT_FORMAT
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, where runs must not overlap
+    fcntl = None
+
+# Runs the three normalizing scripts, side by side, with their parsing spread
+# over a process pool. The output files are identical to running the scripts
+# one by one. A script is skipped when its raw file, its code and the shared
+# helper modules are unchanged since its last run in the same
+# NORMALIZE_FORMAT, and its output files are still the ones it wrote then.
+# Run it from the ch4 directory, like the scripts themselves.
+
+# Number of worker processes used for parsing
+WORKERS = int(os.getenv('NORMALIZE_WORKERS', str(os.cpu_count() or 1)))
+OUTPUT_DIR = "normalized_data"
+# Content hashes of each script's inputs and outputs from its last run
+CACHE_FILE = os.getenv('NORMALIZE_CACHE_FILE', os.path.join(OUTPUT_DIR, '.normalize_cache.json'))
+# Regenerate every output even when nothing changed
+FORCE = os.getenv('NORMALIZE_FORCE', 'false').lower() == 'true'
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Helper modules every script depends on
+SHARED_MODULES = ['literal_parser.py', 'memory_report.py', 'parallel_apply.py', 'table_writer.py']
+
+# script -> (raw files read, tables written)
+STEPS = {
+    'normalize_movies_metadata': (['./raw_data/movies_metadata.csv'], [
+        'normalized_movies', 'normalized_genres', 'normalized_production_companies',
+        'normalized_production_countries', 'normalized_spoken_languages',
+    ]),
+    'normalize_credits': (['./raw_data/credits.csv'], [
+        'normalized_cast', 'normalized_crew',
+    ]),
+    'normalize_keywords': (['./raw_data/keywords.csv'], [
+        'normalized_keywords', 'normalized_keyword_vocabulary', 'normalized_movie_keywords',
+    ]),
+}
+
+
+def file_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def input_hashes(script, raw_files):
+    hashes = {path: file_hash(path) for path in raw_files}
+    for name in [f'{script}.py'] + SHARED_MODULES:
+        hashes[name] = file_hash(os.path.join(SCRIPT_DIR, name))
+    return hashes
+
+
+def output_paths(tables):
+    return [os.path.join(OUTPUT_DIR, f'{table}.{OUTPUT_FORMAT}') for table in tables]
+
+
+def is_fresh(entry, inputs, outputs):
+    if entry is None or entry['inputs'] != inputs:
+        return False
+    for path in outputs:
+        if not os.path.exists(path) or entry['outputs'].get(path) != file_hash(path):
+            return False
+    return True
+
+
+def load_cache(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+@contextlib.contextmanager
+def locked_cache(path):
+    # CSV and Parquet runs may overlap and share the cache file
+    if fcntl is None:
+        yield
+        return
+    with open(f'{path}.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def save_cache_entry(path, key, entry):
+    """Store one script's entry, keeping what other runs saved meanwhile."""
+    with locked_cache(path):
+        cache = load_cache(path)
+        cache[key] = entry
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_path, path)
+
+
+def run_script(run):
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+def main():
+    # Created here so the scripts running side by side never race on it
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with locked_cache(CACHE_FILE):
+        cache = {} if FORCE else load_cache(CACHE_FILE)
+
+    # CSV and Parquet outputs are cached separately
+    stale = {}
+    for script, (raw_files, tables) in STEPS.items():
+        inputs = input_hashes(script, raw_files)
+        if is_fresh(cache.get(f'{script}.{OUTPUT_FORMAT}'), inputs, output_paths(tables)):
+            print(f"{script}: inputs unchanged, skipped")
+        else:
+            stale[script] = inputs
+    if not stale:
+        print("Normalized data is up to date")
+        return
+
+    with ProcessPoolExecutor(max_workers=WORKERS) as processes, ThreadPoolExecutor(max_workers=len(stale)) as threads:
+        runs = {
+            'normalize_movies_metadata': partial(normalize_movies_metadata.main, processes),
+            'normalize_credits': partial(normalize_credits.main, processes, max_pending=2 * WORKERS),
+            'normalize_keywords': partial(normalize_keywords.main, processes),
+        }
+        futures = {threads.submit(run_script, runs[script]): script for script in stale}
+        for future in as_completed(futures):
+            script = futures[future]
+            elapsed = future.result()
+            outputs = output_paths(STEPS[script][1])
+            save_cache_entry(CACHE_FILE, f'{script}.{OUTPUT_FORMAT}',
+                             {'inputs': stale[script], 'outputs': {path: file_hash(path) for path in outputs}})
+            print(f"{script} finished in {elapsed:.1f}s")
+    print(f"Normalization done with {WORKERS} worker processes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import os
+import pandas as pd
+
+# The normalizing scripts write CSV by default. With NORMALIZE_FORMAT=parquet
+# they write typed, zstd-compressed Parquet files instead (requires pyarrow):
+# IDs are stored as int32, numbers as floats and small vocabularies such as
+# crew jobs or language codes as dictionary-encoded (categorical) strings, so
+# the graph loader no longer has to parse every value from text.
+OUTPUT_FORMAT = os.getenv('NORMALIZE_FORMAT', 'csv')
+
+# Column types of each normalized table when written as Parquet
+SCHEMAS = {
+    'normalized_movies': {
+        'tmdbId': 'int32', 'original_title': 'string', 'adult': 'int8', 'budget': 'int64',
+        'imdb_id': 'string', 'original_language': 'category', 'revenue': 'float64', 'tagline': 'string',
+        'title': 'string', 'release_date': 'string', 'runtime': 'float64', 'overview': 'string',
+        'belongs_to_collection': 'category',
+    },
+    'normalized_genres': {'genre_id': 'int32', 'genre_name': 'category', 'tmdbId': 'int32'},
+    'normalized_production_companies': {'company_id': 'int32', 'company_name': 'string', 'tmdbId': 'int32'},
+    'normalized_production_countries': {'country_code': 'category', 'country_name': 'category', 'tmdbId': 'int32'},
+    'normalized_spoken_languages': {'language_code': 'category', 'language_name': 'category', 'tmdbId': 'int32'},
+    'normalized_keywords': {'tmdbId': 'int32', 'keywords': 'string'},
+    'normalized_keyword_vocabulary': {'keyword_id': 'int32', 'keyword': 'string'},
+    'normalized_movie_keywords': {'tmdbId': 'int32', 'keyword_id': 'int32'},
+    'normalized_cast': {'actor_id': 'int32', 'name': 'string', 'character': 'string', 'cast_id': 'int32',
+                        'tmdbId': 'int32'},
+    'normalized_crew': {'crew_id': 'int32', 'name': 'string', 'job': 'category', 'tmdbId': 'int32'},
+}
+
+
+def _arrow_table(df, types):
+    import pyarrow as pa
+
+    arrays, fields = [], []
+    for column in df.columns:
+        kind = types.get(column, 'string')
+        values = df[column]
+        if kind in ('int8', 'int32', 'int64'):
+            # Values that are not integers (the few malformed rows of the raw
+            # files) are stored as nulls, which toInteger() would have given
+            array = pa.array(pd.to_numeric(values, errors='coerce').astype('Int64'), from_pandas=True).cast(kind)
+        elif kind == 'float64':
+            array = pa.array(pd.to_numeric(values, errors='coerce'), type=pa.float64(), from_pandas=True)
+        else:
+            array = pa.array(values.astype('string'), type=pa.string(), from_pandas=True)
+            if kind == 'category':
+                array = array.dictionary_encode()
+        arrays.append(array)
+        fields.append(pa.field(column, array.type))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+class TableWriter:
+    """Write one normalized table, possibly in several appended parts.
+
+    name is the file name without extension, for example 'normalized_cast';
+    the extension follows OUTPUT_FORMAT.
+    """
+
+    def __init__(self, output_dir, name, output_format=OUTPUT_FORMAT):
+        if output_format not in ('csv', 'parquet'):
+            raise ValueError(f"Unknown NORMALIZE_FORMAT {output_format!r}, expected 'csv' or 'parquet'")
+        self.name = name
+        self.output_format = output_format
+        self.path = os.path.join(output_dir, f'{name}.{output_format}')
+        self.first = True
+        self.parquet_writer = None
+
+    def write(self, df):
+        if self.output_format == 'csv':
+            # Append, writing the header only once
+            df.to_csv(self.path, mode='w' if self.first else 'a', header=self.first, index=False)
+        else:
+            import pyarrow.parquet as pq
+
+            table = _arrow_table(df, SCHEMAS.get(self.name, {}))
+            if self.parquet_writer is None:
+                self.parquet_writer = pq.ParquetWriter(self.path, table.schema, compression='zstd')
+            self.parquet_writer.write_table(table)
+        self.first = False
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+            self.parquet_writer = None
+
+
+def write_table(df, output_dir, name):
+    writer = TableWriter(output_dir, name)
+    writer.write(df)
+    writer.close()
+    return writer.path
@@ -0,0 +1,41 @@
+import os
+import csv
+
+# Rows decoded from an Arrow record batch at a time when reading Parquet
+PARQUET_BATCH_SIZE = 10000
+
+
+def is_parquet(path):
+    return path.endswith('.parquet')
+
+
+def iter_rows(path, columns=None):
+    """Yield the rows of a normalized CSV or Parquet file as dicts.
+
+    Empty CSV fields become None, like nulls in Parquet; Parquet values keep
+    their stored types. columns limits the fields of each row; for Parquet
+    only those columns are read from disk (requires pyarrow).
+    """
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        if columns is not None:
+            columns = [name for name in parquet_file.schema_arrow.names if name in columns]
+        for batch in parquet_file.iter_batches(batch_size=PARQUET_BATCH_SIZE, columns=columns):
+            yield from batch.to_pylist()
+        return
+
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if columns is not None:
+                row = {key: value for key, value in row.items() if key in columns}
+            yield {key: (value if value != '' else None) for key, value in row.items()}
+
+
+def table_name(path):
+    """Name of the normalized CSV a file stands for, whatever its format."""
+    name = os.path.basename(path)
+    if is_parquet(name):
+        return os.path.splitext(name)[0] + '.csv'
+    return name
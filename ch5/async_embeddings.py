@@ -0,0 +1,224 @@
+import os
+import time
+import base64
+import heapq
+import asyncio
+import itertools
+import openai
+import numpy as np
+from openai import AsyncOpenAI
+from neo4j import AsyncGraphDatabase
+from embedding_cache import get_cache
+from rate_limiter import AdaptiveRateLimiter, backoff_delay
+from generate_embeddings import (
+    NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD, EMBEDDING_MODEL,
+    EMBEDDING_WRITE_BATCH_SIZE, EMBEDDING_QUEUE_SIZE, EMBEDDING_REQUESTS_PER_MINUTE,
+    EMBEDDING_TOKENS_PER_MINUTE, EMBEDDING_MAX_RETRIES, TRANSIENT_ERRORS, WRITE_EMBEDDINGS_QUERY,
+    batch_movies, cached_batches, check_embedding, count_tokens, retry_after, split_cached,
+)
+
+# asyncio alternative to generate_embeddings.py. One event loop drives the
+# AsyncOpenAI client (httpx) and the async Neo4j driver, so a request in
+# flight costs a coroutine instead of a blocked thread and hundreds of them
+# can be outstanding at once. Batching, the embedding cache, the rate limiter,
+# retries and the bounded queue to the writer work as in the thread pool.
+
+# The most requests ever in flight; the rate limiter finds what the API sustains
+EMBEDDING_ASYNC_MAX_CONCURRENCY = int(os.getenv('EMBEDDING_ASYNC_MAX_CONCURRENCY', '256'))
+# Wire format of the vectors: base64 is far cheaper to parse than JSON floats
+EMBEDDING_ENCODING_FORMAT = os.getenv('EMBEDDING_ENCODING_FORMAT', 'base64')
+
+
+# OPENAI_API_KEY and OPENAI_BASE_URL are read from the environment. Retries go
+# through the rate limiter
+def create_client():
+    return AsyncOpenAI(max_retries=0)
+
+
+# The client only decodes base64 when it chose the format itself, so vectors
+# asked for explicitly as base64 arrive as strings of little-endian float32
+def decode_embedding(embedding, encoding_format):
+    if encoding_format == 'base64':
+        return np.frombuffer(base64.b64decode(embedding), dtype='<f4').tolist()
+    return embedding
+
+
+# Embed one batch of overviews in a single request; new vectors are added to
+# the embedding cache from a worker thread so the event loop never waits on disk
+async def embed_batch_async(client, batch, cache=None, encoding_format=EMBEDDING_ENCODING_FORMAT):
+    response = await client.embeddings.create(model=EMBEDDING_MODEL, input=[overview for _, overview in batch],
+                                              encoding_format=encoding_format)
+    vectors = [check_embedding(decode_embedding(item.embedding, encoding_format))
+               for item in sorted(response.data, key=lambda item: item.index)]
+    if cache is not None:
+        await asyncio.to_thread(cache.put_many, EMBEDDING_MODEL,
+                                [(overview, vector) for (_, overview), vector in zip(batch, vectors)])
+    return [(tmdbId, vector) for (tmdbId, _), vector in zip(batch, vectors)]
+
+
+async def _write_embedding_batch_async(tx, rows):
+    result = await tx.run(WRITE_EMBEDDINGS_QUERY, rows=rows)
+    return await result.consume()
+
+
+# Store embeddings as they arrive, batch_size movies per write transaction
+async def store_embeddings_async(driver, embedded_batches, batch_size=EMBEDDING_WRITE_BATCH_SIZE):
+    pending = []
+    batches = written = 0
+    start = time.perf_counter()
+    async with driver.session() as session:
+        async def write(chunk):
+            nonlocal batches, written
+            rows = [{"tmdbId": tmdbId, "embedding": embedding} for tmdbId, embedding in chunk]
+            await session.execute_write(_write_embedding_batch_async, rows)
+            batches += 1
+            written += len(rows)
+            print(f"✅ Stored {written} embeddings")
+
+        async for embeddings in embedded_batches:
+            pending.extend(embeddings)
+            while len(pending) >= batch_size:
+                await write(pending[:batch_size])
+                del pending[:batch_size]
+        if pending:
+            await write(pending)
+    elapsed = time.perf_counter() - start
+    rate = batches / elapsed if elapsed > 0 else 0.0
+    print(f"✅ Stored {written} embeddings in {batches} batches, {elapsed:.2f}s ({rate:.1f} batches/s)")
+
+
+async def generate_and_store_embeddings_async(driver, client, movies, max_concurrency=EMBEDDING_ASYNC_MAX_CONCURRENCY,
+                                              cache=None, limiter=None, encoding_format=EMBEDDING_ENCODING_FORMAT):
+    cached, movies, generation = split_cached(movies, cache)
+    if cached:
+        print(f"♻️ Found {len(cached)} embeddings in the cache")
+    batches = list(batch_movies(movies))
+    print(f"🔄 Generating embeddings for {sum(len(batch) for batch in batches)} movies in {len(batches)} requests")
+
+    if limiter is None:
+        limiter = AdaptiveRateLimiter(EMBEDDING_REQUESTS_PER_MINUTE, EMBEDDING_TOKENS_PER_MINUTE, max_concurrency)
+    results = asyncio.Queue(maxsize=EMBEDDING_QUEUE_SIZE)
+    # Held from sending a batch until the writer has it, so a slow writer
+    # stops new requests instead of piling up finished ones
+    slots = asyncio.Semaphore(max_concurrency)
+    # Batches waiting to be sent, as (ready at, order, attempt, batch)
+    work = [(0.0, order, 0, batch) for order, batch in enumerate(batches)]
+    order = itertools.count(len(batches))
+    work_ready = asyncio.Condition()
+    released = asyncio.Condition()
+    counts = {'remaining': len(batches), 'retries': 0, 'lost': 0}
+    tasks = set()
+
+    async def notify(condition):
+        async with condition:
+            condition.notify_all()
+
+    async def wait_for(condition, timeout):
+        try:
+            await asyncio.wait_for(condition.wait(), timeout=timeout)
+        except TimeoutError:
+            pass
+
+    async def embed(batch, attempt):
+        start = time.perf_counter()
+        embeddings = []
+        try:
+            embeddings = await embed_batch_async(client, batch, cache, encoding_format)
+        except TRANSIENT_ERRORS as e:
+            limiter.release(throttled=isinstance(e, openai.RateLimitError),
+                            failed=not isinstance(e, openai.RateLimitError))
+            await notify(released)
+            if attempt < EMBEDDING_MAX_RETRIES:
+                counts['retries'] += 1
+                ready_at = time.monotonic() + backoff_delay(attempt, retry_after=retry_after(e))
+                heapq.heappush(work, (ready_at, next(order), attempt + 1, batch))
+                slots.release()
+                await notify(work_ready)
+                return
+            print(f"❌ Giving up on a batch of {len(batch)} movies after {attempt + 1} attempts: {e}")
+            counts['lost'] += len(batch)
+        except Exception as e:
+            limiter.release()
+            await notify(released)
+            print(f"❌ Error embedding a batch of {len(batch)} movies: {e}")
+            counts['lost'] += len(batch)
+        else:
+            limiter.release(latency=time.perf_counter() - start)
+            await notify(released)
+        # Every batch puts exactly one item, so the writer knows when to stop
+        counts['remaining'] -= 1
+        await results.put(embeddings)
+        slots.release()
+        await notify(work_ready)
+
+    async def dispatch():
+        while counts['remaining']:
+            async with work_ready:
+                wait = work[0][0] - time.monotonic() if work else 1.0
+                if wait > 0:
+                    await wait_for(work_ready, min(wait, 1.0))
+                    continue
+                _, _, attempt, batch = heapq.heappop(work)
+            tokens = sum(count_tokens(overview) for _, overview in batch)
+            await slots.acquire()
+            async with released:
+                while (wait := limiter.try_acquire(tokens)) > 0:
+                    await wait_for(released, wait)
+            task = asyncio.create_task(embed(batch, attempt))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    async def queued_results():
+        for embeddings in cached_batches(cache, cached, generation):
+            yield embeddings
+        for _ in batches:
+            yield await results.get()
+
+    dispatcher = asyncio.create_task(dispatch())
+    try:
+        await store_embeddings_async(driver, queued_results())
+    finally:
+        # If writing failed, stop sending and drop the requests in flight
+        for task in [dispatcher, *tasks]:
+            task.cancel()
+        await asyncio.gather(dispatcher, *tasks, return_exceptions=True)
+
+    stats = limiter.stats
+    print(f"📈 {stats['requests']} requests, {stats['throttled']} throttled, {stats['failed']} failed, "
+          f"{counts['retries']} retried, peak concurrency {stats['peak_limit']:.0f}")
+    if counts['lost']:
+        print(f"⚠️ {counts['lost']} movies still have no embedding; run again to retry them")
+
+
+# Retrieve the movies without an embedding
+async def retrieve_movie_plots_async(driver):
+    query = """
+    MATCH (m:Movie)
+    WHERE m.embedding IS NULL
+    RETURN m.tmdbId AS tmdbId, m.title AS title, m.overview AS overview
+    """
+    async with driver.session() as session:
+        result = await session.run(query)
+        return [{"tmdbId": row["tmdbId"], "title": row["title"], "overview": row["overview"]}
+                async for row in result]
+
+
+async def main_async():
+    client = create_client()
+    try:
+        async with AsyncGraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD)) as driver:
+            movies = await retrieve_movie_plots_async(driver)
+            if not movies:
+                print("No movies found with missing embeddings.")
+                return
+            await generate_and_store_embeddings_async(driver, client, movies, cache=get_cache())
+    finally:
+        await client.close()
+
+
+def main():
+    asyncio.run(main_async())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import socket
+import asyncio
+import subprocess
+import contextlib
+import io
+
+# Compares the thread-pool embedding pipeline (generate_embeddings.py) with
+# the asyncio one (async_embeddings.py) against stub_embedding_server.py,
+# started in its own process so the CPU time measured is the client's only.
+# Neo4j writes are counted and discarded. Both engines run at the same fixed
+# concurrency, from 8 to hundreds of requests in flight, and both ask for the
+# vectors as JSON floats (Haystack's format), so the difference is the
+# engine, not the parsing. Run it from ch5.
+
+PORT = int(os.getenv('BENCHMARK_STUB_PORT', '8766'))
+LATENCY_MS = os.getenv('BENCHMARK_LATENCY_MS', '200')
+MOVIES = int(os.getenv('BENCHMARK_MOVIES', '4000'))
+CONCURRENCY = [int(n) for n in os.getenv('BENCHMARK_CONCURRENCY', '8,64,256').split(',')]
+
+os.environ.update(OPENAI_API_KEY='stub', OPENAI_BASE_URL=f'http://127.0.0.1:{PORT}/v1')
+# Small requests, so the run is dominated by request overhead and latency
+os.environ.setdefault('EMBEDDING_BATCH_SIZE', '8')
+os.environ.setdefault('NEO4J_URI', 'bolt://localhost:7687')
+
+import generate_embeddings
+import async_embeddings
+from rate_limiter import AdaptiveRateLimiter
+
+
+class NullDriver:
+    """Stands in for the Neo4j driver, counting the embedding rows written."""
+
+    def __init__(self):
+        self.rows = 0
+
+    @contextlib.contextmanager
+    def session(self):
+        yield self
+
+    def execute_write(self, work, rows):
+        self.rows += len(rows)
+
+
+class AsyncNullDriver(NullDriver):
+
+    @contextlib.asynccontextmanager
+    async def session(self):
+        yield self
+
+    async def execute_write(self, work, rows):
+        self.rows += len(rows)
+
+
+def fixed_limiter(concurrency):
+    # No quotas and no adapting: the limit starts at its maximum, never grows
+    # past it (latency_tolerance=inf) and is never cut (decrease_factor=1), so
+    # both engines keep exactly this many requests in flight
+    return AdaptiveRateLimiter(10 ** 9, 10 ** 12, concurrency, initial_concurrency=concurrency,
+                               decrease_factor=1.0, latency_tolerance=float('inf'))
+
+
+def synthetic_movies(count):
+    return [{'tmdbId': i, 'title': f'Movie {i}', 'overview': f'Overview of movie {i}. ' * (i % 5 + 5)}
+            for i in range(count)]
+
+
+def start_stub():
+    env = dict(os.environ, STUB_EMBEDDING_PORT=str(PORT), STUB_EMBEDDING_LATENCY_MS=LATENCY_MS)
+    server = subprocess.Popen([sys.executable, 'stub_embedding_server.py'], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        with contextlib.suppress(OSError), socket.create_connection(('127.0.0.1', PORT), timeout=0.1):
+            return server
+        time.sleep(0.1)
+    server.kill()
+    raise RuntimeError(f"Stub embedding server did not start on port {PORT}")
+
+
+def run_threads(movies, concurrency, limiter):
+    driver = generate_embeddings.driver = NullDriver()
+    embedder = generate_embeddings.initialize_haystack()
+    generate_embeddings.generate_and_store_embeddings(embedder, movies, max_workers=concurrency, limiter=limiter)
+    return driver.rows
+
+
+def run_async(movies, concurrency, limiter):
+    driver = AsyncNullDriver()
+
+    async def run():
+        client = async_embeddings.create_client()
+        try:
+            await async_embeddings.generate_and_store_embeddings_async(
+                driver, client, movies, max_concurrency=concurrency, limiter=limiter,
+                encoding_format='float')
+        finally:
+            await client.close()
+
+    asyncio.run(run())
+    return driver.rows
+
+
+# Returns (seconds, CPU seconds, failed or throttled requests)
+def measure(run, movies, concurrency):
+    limiter = fixed_limiter(concurrency)
+    wall, cpu = time.perf_counter(), time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        rows = run(movies, concurrency, limiter)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    assert rows == len(movies), f"stored {rows} of {len(movies)} embeddings"
+    assert limiter.limit == concurrency, f"ran at {limiter.limit} requests in flight, not {concurrency}"
+    return wall, cpu, limiter.stats['failed'] + limiter.stats['throttled']
+
+
+def main():
+    movies = synthetic_movies(MOVIES)
+    requests = len(list(generate_embeddings.batch_movies(movies)))
+    print(f"{MOVIES} movies in {requests} requests, stub latency {LATENCY_MS} ms")
+    server = start_stub()
+    try:
+        print(f"{'engine':<8}{'in flight':>10}{'seconds':>10}{'requests/s':>12}{'failed':>8}"
+              f"{'CPU s':>8}{'CPU ms/req':>12}")
+        for concurrency in CONCURRENCY:
+            for name, run in (('threads', run_threads), ('asyncio', run_async)):
+                wall, cpu, failed = measure(run, movies, concurrency)
+                print(f"{name:<8}{concurrency:>10}{wall:>10.2f}{requests / wall:>12.1f}{failed:>8}"
+                      f"{cpu:>8.2f}{1000 * cpu / requests:>12.2f}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
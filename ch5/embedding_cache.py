@@ -0,0 +1,227 @@
+import os
+import json
+import hashlib
+import threading
+import contextlib
+import numpy as np
+from typing import Any, Dict, List
+from haystack import component
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, where the cache is only safe within one process
+    fcntl = None
+
+# Embeddings already paid for are kept on disk, so rebuilding the graph or
+# asking the same question twice does not call the API again. Each vector is
+# keyed by a hash of the model name and the whitespace-normalized text:
+#
+#   embedding_cache/vectors.f32   float32 rows, appended and memory-mapped
+#   embedding_cache/index.json    key -> row number (offset = row * dimensions * 4)
+#
+# Turn it off with EMBEDDING_CACHE=false.
+CACHE_ENABLED = os.getenv('EMBEDDING_CACHE', 'true').lower() == 'true'
+CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'embedding_cache'))
+
+
+def cache_key(model, text):
+    normalized = ' '.join(str(text).split())
+    return hashlib.blake2b(f'{model}\x00{normalized}'.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    """Content-addressed float32 embedding store.
+
+    Vectors are only ever appended; putting a key again points it at a new
+    row and leaves the old one unused until compact() rewrites the file.
+    Appends and compactions hold an exclusive lock on embedding_cache/.lock
+    and lookups a shared one, re-reading the index whenever another process
+    changed it, so the bulk embedder and the search scripts can share a
+    cache directory. Safe to share between threads too.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.vectors_path = os.path.join(cache_dir, 'vectors.f32')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.lock_path = os.path.join(cache_dir, '.lock')
+        self.lock = threading.Lock()
+        self.dimensions = None
+        self.index = {}
+        self.rows = 0
+        # Bumped by every compaction, which renumbers the rows
+        self.generation = 0
+        self._index_version = None
+        self._vectors = None
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._locked(shared=True):
+            self._refresh()
+
+    def __len__(self):
+        return len(self.index)
+
+    @contextlib.contextmanager
+    def _locked(self, shared=False):
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        # Pick up what other processes appended or compacted since the last look
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if version != self._index_version:
+            with open(self.index_path, encoding='utf-8') as f:
+                saved = json.load(f)
+            self.dimensions = saved['dimensions']
+            self.index = saved['index']
+            if saved.get('generation', 0) != self.generation:
+                self._vectors = None  # Maps the file compaction replaced
+            self.generation = saved.get('generation', 0)
+            self._index_version = version
+        if self.dimensions and os.path.exists(self.vectors_path):
+            # A row cut short by an interrupted write is never referenced
+            self.rows = os.path.getsize(self.vectors_path) // (self.dimensions * 4)
+
+    def _mapped(self):
+        # Re-mapped lazily after appends, so readers always see every row
+        if self._vectors is None or len(self._vectors) < self.rows:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r',
+                                      shape=(self.rows, self.dimensions))
+        return self._vectors
+
+    def _save_index(self):
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'dimensions': self.dimensions, 'generation': self.generation, 'index': self.index}, f)
+        os.replace(tmp_path, self.index_path)
+        stat = os.stat(self.index_path)
+        self._index_version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def get(self, model, text):
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model, texts):
+        """Return the cached vector of each text as a list of floats, or None."""
+        with self._locked(shared=True):
+            self._refresh()
+            rows = [self.index.get(cache_key(model, text)) for text in texts]
+            if not any(row is not None for row in rows):
+                return [None] * len(texts)
+            vectors = self._mapped()
+            return [None if row is None else vectors[row].tolist() for row in rows]
+
+    def find_rows(self, model, texts):
+        """Return (rows, generation): the row of each text, or None, without reading a vector.
+
+        Pass both to read_rows() later to fetch the vectors in slices.
+        """
+        with self._locked(shared=True):
+            self._refresh()
+            return [self.index.get(cache_key(model, text)) for text in texts], self.generation
+
+    def read_rows(self, rows, generation):
+        """Return the vectors of rows from find_rows() as a float32 array."""
+        with self._locked(shared=True):
+            self._refresh()
+            if generation != self.generation:
+                raise RuntimeError("The embedding cache was compacted since its rows were looked up")
+            return np.array(self._mapped()[rows])
+
+    def put(self, model, text, embedding):
+        self.put_many(model, [(text, embedding)])
+
+    def put_many(self, model, items):
+        """Append (text, embedding) pairs and save the index once."""
+        if not items:
+            return
+        vectors = np.asarray([embedding for _, embedding in items], dtype=np.float32)
+        with self._locked():
+            self._refresh()
+            if self.dimensions is None:
+                self.dimensions = vectors.shape[1]
+            elif vectors.shape[1] != self.dimensions:
+                raise ValueError(f"Embedding cache holds {self.dimensions}-dimensional vectors, got {vectors.shape[1]}")
+            row_bytes = self.dimensions * 4
+            with open(self.vectors_path, 'ab') as f:
+                size = f.seek(0, os.SEEK_END)
+                # Pad a partial row left by an interrupted write instead of
+                # overwriting it, so rows stay aligned
+                first_row = -(-size // row_bytes)
+                f.write(b'\0' * (first_row * row_bytes - size))
+                f.write(vectors.tobytes())
+            for offset, (text, _) in enumerate(items):
+                self.index[cache_key(model, text)] = first_row + offset
+            self.rows = first_row + len(items)
+            self._save_index()
+
+    def compact(self, keep=None):
+        """Rewrite the vector file with only the rows still indexed.
+
+        keep, a set of keys from cache_key(), also drops every other entry.
+        Returns the number of rows removed.
+        """
+        with self._locked():
+            self._refresh()
+            if self.dimensions is None or self.rows == 0:
+                return 0
+            index = {key: row for key, row in self.index.items() if keep is None or key in keep}
+            vectors = self._mapped()
+            tmp_path = f'{self.vectors_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                for key, row in index.items():
+                    f.write(vectors[row].tobytes())
+            # Unmapped before the file is replaced
+            vectors = self._vectors = None
+            removed = self.rows - len(index)
+            os.replace(tmp_path, self.vectors_path)
+            self.index = {key: new_row for new_row, key in enumerate(index)}
+            self.rows = len(index)
+            self.generation += 1
+            self._save_index()
+            return removed
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide cache, or None when EMBEDDING_CACHE=false."""
+    global _shared_cache
+    if not CACHE_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache()
+        return _shared_cache
+
+
+# Drop-in replacement for a text embedder in a pipeline: answers from the
+# cache and only calls the wrapped embedder for texts it has not seen
+@component
+class CachedTextEmbedder:
+    def __init__(self, embedder, cache=None):
+        self.embedder = embedder
+        self.cache = cache if cache is not None else get_cache()
+
+    @component.output_types(embedding=List[float], meta=Dict[str, Any])
+    def run(self, text: str):
+        model = self.embedder.model
+        if self.cache is not None:
+            embedding = self.cache.get(model, text)
+            if embedding is not None:
+                return {"embedding": embedding, "meta": {"model": model, "cached": True}}
+        result = self.embedder.run(text=text)
+        if self.cache is not None and result.get("embedding"):
+            self.cache.put(model, text, result["embedding"])
+        return result
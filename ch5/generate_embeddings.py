@@ -1,14 +1,28 @@
 import os
+import time
+import heapq
+import queue
+import logging
+import itertools
+import threading
 import openai
 import numpy as np
 from dotenv import load_dotenv
 from neo4j import GraphDatabase
 from haystack.document_stores.in_memory import InMemoryDocumentStore
-from haystack.components.embedders import OpenAITextEmbedder
+from haystack import Document
+from haystack.components.embedders import OpenAIDocumentEmbedder
 from haystack.utils.auth import Secret
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
+from embedding_cache import get_cache
+from rate_limiter import AdaptiveRateLimiter, backoff_delay
 import warnings
 
+try:
+    import tiktoken
+except ImportError:  # Token counts are estimated from the text length instead
+    tiktoken = None
+
 warnings.filterwarnings("ignore")
 load_dotenv()
 
@@ -21,20 +35,143 @@ NEO4J_PASSWORD = os.getenv('NEO4J_PASSWORD')
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 openai.api_key = OPENAI_API_KEY
 
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# Length of the model's vectors, as the movie vector index expects
+EMBEDDING_DIMENSIONS = 1536
+# Overviews sent per embedding request, limited both by count and by an
+# estimated token budget (the API accepts up to 2048 inputs per request)
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '256'))
+EMBEDDING_BATCH_TOKENS = int(os.getenv('EMBEDDING_BATCH_TOKENS', '100000'))
+# Embeddings written to Neo4j per transaction
+EMBEDDING_WRITE_BATCH_SIZE = int(os.getenv('EMBEDDING_WRITE_BATCH_SIZE', '1000'))
+# Embedded batches waiting for the writer
+EMBEDDING_QUEUE_SIZE = int(os.getenv('EMBEDDING_QUEUE_SIZE', '8'))
+# API quotas and the most requests ever in flight; the rate limiter finds the
+# concurrency the API sustains below that
+EMBEDDING_REQUESTS_PER_MINUTE = int(os.getenv('EMBEDDING_REQUESTS_PER_MINUTE', '3000'))
+EMBEDDING_TOKENS_PER_MINUTE = int(os.getenv('EMBEDDING_TOKENS_PER_MINUTE', '1000000'))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv('EMBEDDING_MAX_CONCURRENCY', '32'))
+# Attempts of a batch after a 429, a timeout or a server error
+EMBEDDING_MAX_RETRIES = int(os.getenv('EMBEDDING_MAX_RETRIES', '8'))
+
+# Errors worth retrying; anything else (a bad request) would fail again
+TRANSIENT_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+# Failed requests are counted and retried here, not logged with a traceback
+logging.getLogger("haystack.components.embedders.openai_document_embedder").setLevel(logging.CRITICAL)
+
 # Initialize Neo4j driver
 driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
 
 
-# Initialize Haystack with OpenAI for text embeddings
+# Initialize Haystack with OpenAI for text embeddings. The document embedder
+# sends up to batch_size texts in a single request; OPENAI_BASE_URL points it
+# at another endpoint, such as stub_embedding_server.py
 def initialize_haystack():
     document_store = InMemoryDocumentStore()
-    embedder = OpenAITextEmbedder(
+    embedder = OpenAIDocumentEmbedder(
         api_key=Secret.from_env_var("OPENAI_API_KEY"),
-        model="text-embedding-ada-002"
+        model=EMBEDDING_MODEL,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        progress_bar=False,
+        raise_on_failure=True,
+        # Retries go through the rate limiter instead of the OpenAI client
+        max_retries=0
     )
+    embedder.warm_up()
     return embedder
 
 
+# Number of tokens a text costs, estimated when tiktoken is not installed
+def count_tokens(text):
+    if tiktoken is not None:
+        return len(tiktoken.encoding_for_model(EMBEDDING_MODEL).encode(text))
+    # English averages about 4 characters per token; 3 bytes leaves headroom
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+# Group the movies that have an overview into request-sized batches
+def batch_movies(movies, max_items=EMBEDDING_BATCH_SIZE, max_tokens=EMBEDDING_BATCH_TOKENS):
+    batch, batch_tokens = [], 0
+    for movie in movies:
+        title = movie.get("title", "Unknown Title")
+        overview = str(movie.get("overview", "")).strip()
+
+        if not overview:
+            print(f"⚠️ Skipping {title} — No overview available.")
+            continue
+
+        tokens = count_tokens(overview)
+        if batch and (len(batch) >= max_items or batch_tokens + tokens > max_tokens):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append((movie.get("tmdbId"), overview))
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+# Raise ValueError unless vector is a list of EMBEDDING_DIMENSIONS floats,
+# so a malformed response never reaches the cache or Neo4j
+def check_embedding(vector):
+    if not isinstance(vector, list) or len(vector) != EMBEDDING_DIMENSIONS:
+        kind = f"{len(vector)} values" if isinstance(vector, list) else type(vector).__name__
+        raise ValueError(f"Expected a list of {EMBEDDING_DIMENSIONS} floats as embedding, got {kind}")
+    if not all(isinstance(value, float) for value in vector):
+        raise ValueError("Expected an embedding of floats")
+    return vector
+
+
+# Embed one batch of overviews in a single request and map the vectors back
+# to their movies through the document metadata. New vectors are added to the
+# embedding cache
+def embed_batch(embedder, batch, cache=None):
+    documents = [Document(content=overview, meta={"tmdbId": tmdbId}) for tmdbId, overview in batch]
+    result = embedder.run(documents=documents)
+    embedded = [doc for doc in result["documents"] if doc.embedding]
+    for doc in embedded:
+        check_embedding(doc.embedding)
+    if cache is not None:
+        cache.put_many(EMBEDDING_MODEL, [(doc.content, doc.embedding) for doc in embedded])
+    return [(doc.meta["tmdbId"], doc.embedding) for doc in embedded]
+
+
+# Seconds the server asked us to wait before retrying, if it said
+def retry_after(error):
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+# Split the movies into (tmdbId, cache row) pairs for the overviews already
+# in the cache and the movies that still need an API call. Only row numbers
+# are kept here; cached_batches() reads the vectors one write batch at a time,
+# so a warm rerun holds no more vectors in memory than a cold one.
+# Returns (cached, missing, generation).
+def split_cached(movies, cache):
+    if cache is None:
+        return [], movies, None
+    overviews = [str(movie.get("overview", "")).strip() for movie in movies]
+    rows, generation = cache.find_rows(EMBEDDING_MODEL, overviews)
+    cached, missing = [], []
+    for movie, overview, row in zip(movies, overviews, rows):
+        if overview and row is not None:
+            cached.append((movie.get("tmdbId"), row))
+        else:
+            missing.append(movie)
+    return cached, missing, generation
+
+
+# Read the cached vectors from the memory-mapped cache in write-batch slices
+# of (tmdbId, embedding) pairs
+def cached_batches(cache, cached, generation, batch_size=EMBEDDING_WRITE_BATCH_SIZE):
+    for start in range(0, len(cached), batch_size):
+        chunk = cached[start:start + batch_size]
+        vectors = cache.read_rows([row for _, row in chunk], generation)
+        yield [(tmdbId, vector) for (tmdbId, _), vector in zip(chunk, vectors.tolist())]
+
+
 # Retrieve movie plots and titles from Neo4j
 def retrieve_movie_plots():
     query = """
@@ -55,52 +192,156 @@ def retrieve_movie_plots():
     return movies
 
 
-# Store the embedding in Neo4j (runs in the main thread)
-def store_embedding_in_neo4j(tmdbId, embedding):
-    query = """
-    MATCH (m:Movie {tmdbId: $tmdbId})
-    SET m.embedding = $embedding
-    """
+# Write one batch of embeddings. setNodeVectorProperty stores each vector as a
+# float32 array, half the size of a plain list property of floats
+WRITE_EMBEDDINGS_QUERY = """
+UNWIND $rows AS row
+MATCH (m:Movie {tmdbId: row.tmdbId})
+CALL db.create.setNodeVectorProperty(m, 'embedding', row.embedding)
+"""
+
+
+def _write_embedding_batch(tx, rows):
+    return tx.run(WRITE_EMBEDDINGS_QUERY, rows=rows).consume()
+
+
+# Store embeddings in Neo4j as they arrive (runs in the main thread).
+# embedded_batches yields lists of (tmdbId, embedding); every batch_size
+# movies are committed in one managed write transaction, so an interruption
+# only loses the vectors not written yet.
+def store_embeddings_in_neo4j(embedded_batches, batch_size=EMBEDDING_WRITE_BATCH_SIZE):
+    pending = []
+    batches = written = 0
+    start = time.perf_counter()
     with driver.session() as session:
-        session.run(query, tmdbId=tmdbId, embedding=embedding)
-    print(f"✅ Stored embedding for TMDB ID: {tmdbId}")
+        def write(chunk):
+            nonlocal batches, written
+            rows = [{"tmdbId": tmdbId, "embedding": embedding} for tmdbId, embedding in chunk]
+            session.execute_write(_write_embedding_batch, rows)
+            batches += 1
+            written += len(rows)
+            print(f"✅ Stored {written} embeddings")
 
+        for embeddings in embedded_batches:
+            pending.extend(embeddings)
+            while len(pending) >= batch_size:
+                write(pending[:batch_size])
+                del pending[:batch_size]
+        if pending:
+            write(pending)
+    elapsed = time.perf_counter() - start
+    rate = batches / elapsed if elapsed > 0 else 0.0
+    print(f"✅ Stored {written} embeddings in {batches} batches, {elapsed:.2f}s ({rate:.1f} batches/s)")
 
-# Parallel embedding generation with ThreadPoolExecutor
-def generate_and_store_embeddings(embedder, movies, max_workers=10):
-    results_to_store = []
 
-    def process_movie(movie):
-        title = movie.get("title", "Unknown Title")
-        overview = str(movie.get("overview", "")).strip()
-        tmdbId = movie.get("tmdbId")
+# Streaming embedding pipeline: worker threads embed one batch per request
+# and hand the vectors to the writer through a bounded queue. When Neo4j falls
+# behind, the queue fills up and the workers wait, so memory stays bounded by
+# the queue size instead of growing with the number of movies.
+#
+# A dispatcher thread sends the batches as fast as the rate limiter allows. A
+# batch failing with a 429, a timeout or a server error goes back to the work
+# queue with a jittered backoff, and is only given up after
+# EMBEDDING_MAX_RETRIES attempts; its movies then keep no embedding and are
+# picked up by the next run.
+def generate_and_store_embeddings(embedder, movies, max_workers=EMBEDDING_MAX_CONCURRENCY, cache=None, limiter=None):
+    cached, movies, generation = split_cached(movies, cache)
+    if cached:
+        print(f"♻️ Found {len(cached)} embeddings in the cache")
+    batches = list(batch_movies(movies))
+    print(f"🔄 Generating embeddings for {sum(len(batch) for batch in batches)} movies in {len(batches)} requests")
 
-        if not overview:
-            print(f"⚠️ Skipping {title} — No overview available.")
-            return None
+    if limiter is None:
+        limiter = AdaptiveRateLimiter(EMBEDDING_REQUESTS_PER_MINUTE, EMBEDDING_TOKENS_PER_MINUTE, max_workers)
+    results = queue.Queue(maxsize=EMBEDDING_QUEUE_SIZE)
+    stop = threading.Event()
+    # Batches waiting to be sent, as (ready at, order, attempt, batch)
+    work = [(0.0, order, 0, batch) for order, batch in enumerate(batches)]
+    order = itertools.count(len(batches))
+    work_ready = threading.Condition()
+    counts = {'remaining': len(batches), 'retries': 0, 'lost': 0}
 
+    def finish(embeddings):
+        # Every batch puts exactly one item, so the writer knows when to stop
+        with work_ready:
+            counts['remaining'] -= 1
+            work_ready.notify()
+        while not stop.is_set():
+            try:
+                results.put(embeddings, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def embed_into_queue(batch, attempt):
+        start = time.perf_counter()
         try:
-            print(f"🔄 Generating embedding for: {title}")
-            embedding_result = embedder.run(overview)
-            embedding = embedding_result.get("embedding")
-            if embedding:
-                return (tmdbId, embedding)
-            else:
-                print(f"❌ No embedding generated for: {title}")
+            embeddings = embed_batch(embedder, batch, cache)
+        except TRANSIENT_ERRORS as e:
+            limiter.release(throttled=isinstance(e, openai.RateLimitError),
+                            failed=not isinstance(e, openai.RateLimitError))
+            if attempt < EMBEDDING_MAX_RETRIES:
+                with work_ready:
+                    counts['retries'] += 1
+                    ready_at = time.monotonic() + backoff_delay(attempt, retry_after=retry_after(e))
+                    heapq.heappush(work, (ready_at, next(order), attempt + 1, batch))
+                    work_ready.notify()
+                return
+            print(f"❌ Giving up on a batch of {len(batch)} movies after {attempt + 1} attempts: {e}")
+            with work_ready:
+                counts['lost'] += len(batch)
+            finish([])
+            return
         except Exception as e:
-            print(f"❌ Error processing {title}: {e}")
-        return None
+            limiter.release()
+            print(f"❌ Error embedding a batch of {len(batch)} movies: {e}")
+            with work_ready:
+                counts['lost'] += len(batch)
+            finish([])
+            return
+        limiter.release(latency=time.perf_counter() - start)
+        if len(embeddings) < len(batch):
+            print(f"❌ No embedding generated for {len(batch) - len(embeddings)} movies of a batch")
+        finish(embeddings)
+
+    def dispatch():
+        while not stop.is_set():
+            with work_ready:
+                if counts['remaining'] == 0:
+                    return
+                wait = work[0][0] - time.monotonic() if work else 1.0
+                if wait > 0:
+                    work_ready.wait(timeout=min(wait, 1.0))
+                    continue
+                _, _, attempt, batch = heapq.heappop(work)
+            tokens = sum(count_tokens(overview) for _, overview in batch)
+            if not limiter.acquire(tokens, stop):
+                return
+            executor.submit(embed_into_queue, batch, attempt)
+
+    def queued_results():
+        yield from cached_batches(cache, cached, generation)
+        for _ in batches:
+            yield results.get()
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(process_movie, movie) for movie in movies]
-        for future in as_completed(futures):
-            result = future.result()
-            if result:
-                results_to_store.append(result)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    dispatcher = threading.Thread(target=dispatch, daemon=True)
+    dispatcher.start()
+    try:
+        store_embeddings_in_neo4j(queued_results())
+    finally:
+        # If writing failed, let blocked workers go and skip the batches not started
+        stop.set()
+        with work_ready:
+            work_ready.notify_all()
+        dispatcher.join()
+        executor.shutdown(wait=True, cancel_futures=True)
 
-    # Store all embeddings after parallel processing
-    for tmdbId, embedding in results_to_store:
-        store_embedding_in_neo4j(tmdbId, embedding)
+    stats = limiter.stats
+    print(f"📈 {stats['requests']} requests, {stats['throttled']} throttled, {stats['failed']} failed, "
+          f"{counts['retries']} retried, peak concurrency {stats['peak_limit']:.0f}")
+    if counts['lost']:
+        print(f"⚠️ {counts['lost']} movies still have no embedding; run again to retry them")
 
 
 # Verify a few embeddings from Neo4j
@@ -128,7 +369,7 @@ def main():
         print("No movies found with missing embeddings.")
         return
 
-    generate_and_store_embeddings(embedder, movies, max_workers=20)
+    generate_and_store_embeddings(embedder, movies, cache=get_cache())
     verify_embeddings()
 
 
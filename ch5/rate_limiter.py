@@ -0,0 +1,123 @@
+import time
+import random
+import threading
+
+# Keeps the embedding workers under the API quotas. Two token buckets pace
+# requests and tokens per minute, and the number of requests in flight is
+# adjusted by AIMD (additive increase, multiplicative decrease): every fast
+# success raises the limit by about one slot per round trip, while a 429, a
+# timeout or a latency well above the fastest seen cuts it down.
+
+
+class TokenBucket:
+    """Refills rate_per_minute units per minute, holding at most capacity."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until amount units are available (0 if they are now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+
+class AdaptiveRateLimiter:
+    """Request/token quotas plus an AIMD limit on concurrent requests.
+
+    Call acquire(tokens) (try_acquire(tokens) from an event loop) before a
+    request and release() after it, telling release() whether the request
+    was throttled or failed.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute, max_concurrency,
+                 initial_concurrency=4, decrease_factor=0.5, latency_tolerance=3.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.limit = float(min(initial_concurrency, max_concurrency))
+        self.decrease_factor = decrease_factor
+        # Latency above latency_tolerance times the fastest seen means the
+        # server is queueing our requests, so the limit stops growing
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.min_latency = None
+        self.avg_latency = None
+        self.last_decrease = 0.0
+        self.condition = threading.Condition(threading.RLock())
+        self.stats = {'requests': 0, 'throttled': 0, 'failed': 0, 'peak_limit': self.limit}
+
+    def try_acquire(self, tokens):
+        """Start a request of tokens tokens if allowed now.
+
+        Returns 0 when it started, otherwise the seconds worth waiting
+        before trying again (0.1 when waiting for a request to finish).
+        Never blocks, so an event loop can call it too.
+        """
+        with self.condition:
+            if self.in_flight >= int(self.limit):
+                return 0.1
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if wait > 0:
+                return wait
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+            self.stats['requests'] += 1
+            return 0
+
+    def acquire(self, tokens, stop=None):
+        """Block until a request of tokens tokens may start.
+
+        Returns False if the stop event was set while waiting.
+        """
+        with self.condition:
+            while stop is None or not stop.is_set():
+                wait = self.try_acquire(tokens)
+                if wait == 0:
+                    return True
+                # Woken early by release() when a request finishes
+                self.condition.wait(timeout=min(wait, 0.1))
+            return False
+
+    def release(self, latency=None, throttled=False, failed=False):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled or failed:
+                self.stats['throttled' if throttled else 'failed'] += 1
+                self._decrease()
+            elif latency is not None:
+                self.min_latency = latency if self.min_latency is None else min(self.min_latency, latency)
+                self.avg_latency = latency if self.avg_latency is None else 0.8 * self.avg_latency + 0.2 * latency
+                if self.avg_latency > self.latency_tolerance * self.min_latency:
+                    self._decrease()
+                else:
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                    self.stats['peak_limit'] = max(self.stats['peak_limit'], self.limit)
+            self.condition.notify_all()
+
+    def _decrease(self):
+        # The requests already in flight when the limit was cut report their
+        # failures too; cut at most once per round trip so they count as one
+        now = time.monotonic()
+        if now - self.last_decrease >= (self.avg_latency or 0.0):
+            self.limit = max(1.0, self.limit * self.decrease_factor)
+            self.last_decrease = now
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
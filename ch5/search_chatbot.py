@@ -4,6 +4,7 @@ import gradio as gr
 from dotenv import load_dotenv
 from neo4j import GraphDatabase
 from haystack.components.embedders import OpenAITextEmbedder
+from embedding_cache import CachedTextEmbedder
 from haystack.utils.auth import Secret
 from haystack import Pipeline
 from neo4j_haystack import (
@@ -56,11 +57,11 @@ def perform_vector_search_cypher(user_input):
         RETURN movie.title AS title, movie.overview AS overview, score
     """
 
-    # Embedder
-    embedder = OpenAITextEmbedder(
+    # Embedder, answering repeated questions from the embedding cache
+    embedder = CachedTextEmbedder(OpenAITextEmbedder(
         api_key=Secret.from_env_var("OPENAI_API_KEY"),
         model="text-embedding-ada-002"
-    )
+    ))
 
     # Retriever
     retriever = Neo4jDynamicDocumentRetriever(
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import base64
+import random
+import hashlib
+import threading
+from collections import deque
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A local stand-in for the OpenAI embeddings endpoint, so the embedding
+# scripts can be exercised without an API key or network access:
+#
+#   python stub_embedding_server.py
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub python generate_embeddings.py
+#
+# Every text gets a deterministic unit vector picked by its hash from a pool
+# of STUB_EMBEDDING_POOL_SIZE vectors, computed and encoded (as JSON floats and
+# as base64) once at startup, so answering a request costs little more than
+# joining strings and a benchmark measures the client, not the stub. The
+# server counts the requests and inputs it answered. Like the real API it can
+# also throttle: requests over STUB_EMBEDDING_MAX_IN_FLIGHT concurrent or
+# STUB_EMBEDDING_REQUESTS_PER_MINUTE get a 429, and a STUB_EMBEDDING_ERROR_RATE
+# fraction of requests fails with a 503 (0 turns each of these off).
+
+HOST = os.getenv('STUB_EMBEDDING_HOST', '127.0.0.1')
+PORT = int(os.getenv('STUB_EMBEDDING_PORT', '8765'))
+DIMENSIONS = int(os.getenv('STUB_EMBEDDING_DIMENSIONS', '1536'))
+# Simulated round-trip time of each request
+LATENCY_MS = float(os.getenv('STUB_EMBEDDING_LATENCY_MS', '0'))
+MAX_IN_FLIGHT = int(os.getenv('STUB_EMBEDDING_MAX_IN_FLIGHT', '0'))
+REQUESTS_PER_MINUTE = int(os.getenv('STUB_EMBEDDING_REQUESTS_PER_MINUTE', '0'))
+ERROR_RATE = float(os.getenv('STUB_EMBEDDING_ERROR_RATE', '0'))
+# Distinct vectors served; texts hashing to the same slot share one
+POOL_SIZE = int(os.getenv('STUB_EMBEDDING_POOL_SIZE', '1024'))
+# Connections waiting to be accepted, enough for hundreds of clients at once
+REQUEST_QUEUE_SIZE = int(os.getenv('STUB_EMBEDDING_REQUEST_QUEUE_SIZE', '1024'))
+
+stats = {'requests': 0, 'inputs': 0, 'throttled': 0, 'errors': 0}
+stats_lock = threading.Lock()
+# Read on every request, so a benchmark can change them while serving
+limits = {'max_in_flight': MAX_IN_FLIGHT, 'requests_per_minute': REQUESTS_PER_MINUTE, 'error_rate': ERROR_RATE}
+in_flight = 0
+recent_requests = deque()  # Start times of the requests of the last minute
+
+
+def _pool_vector(slot, dimensions=DIMENSIONS):
+    vector = np.random.default_rng(slot).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+# Each slot's vector with its two encoded forms, ready to paste into a response.
+# The OpenAI client asks for base64 (little-endian float32) unless told otherwise
+pool = [_pool_vector(slot) for slot in range(POOL_SIZE)]
+encoded_pool = {
+    'float': [json.dumps(vector.tolist()) for vector in pool],
+    'base64': [json.dumps(base64.b64encode(vector.astype('<f4').tobytes()).decode('ascii')) for vector in pool],
+}
+
+
+def _slot(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little') % POOL_SIZE
+
+
+def stub_vector(text):
+    return pool[_slot(text)]
+
+
+def stub_embedding(text):
+    return stub_vector(text).tolist()
+
+
+class EmbeddingHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so clients reuse their connections instead of opening one per request
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if not self.path.endswith('/embeddings'):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+        status = self.admit()
+        if status == 429:
+            self.send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests',
+                                           'code': 'rate_limit_exceeded'}}, {'Retry-After': '1'})
+            return
+        try:
+            if LATENCY_MS:
+                time.sleep(LATENCY_MS / 1000)
+            if status == 503:
+                self.send_json(503, {'error': {'message': 'Service unavailable', 'type': 'server_error'}})
+                return
+            with stats_lock:
+                stats['requests'] += 1
+                stats['inputs'] += len(inputs)
+
+            tokens = sum(len(text.split()) for text in inputs)
+            encoded = encoded_pool['base64' if body.get('encoding_format') == 'base64' else 'float']
+            data = ','.join(f'{{"object":"embedding","index":{i},"embedding":{encoded[_slot(text)]}}}'
+                            for i, text in enumerate(inputs))
+            usage = json.dumps({'prompt_tokens': tokens, 'total_tokens': tokens})
+            model = json.dumps(body.get('model', 'stub'))
+            self.send_payload(200, f'{{"object":"list","data":[{data}],"model":{model},"usage":{usage}}}'
+                              .encode('utf-8'))
+        finally:
+            self.leave()
+
+    def admit(self):
+        # 200, or the status this request fails with
+        global in_flight
+        now = time.monotonic()
+        with stats_lock:
+            while recent_requests and recent_requests[0] < now - 60:
+                recent_requests.popleft()
+            if ((limits['max_in_flight'] and in_flight >= limits['max_in_flight'])
+                    or (limits['requests_per_minute'] and len(recent_requests) >= limits['requests_per_minute'])):
+                stats['throttled'] += 1
+                return 429
+            in_flight += 1
+            recent_requests.append(now)
+            if limits['error_rate'] and random.random() < limits['error_rate']:
+                stats['errors'] += 1
+                return 503
+            return 200
+
+    def leave(self):
+        global in_flight
+        with stats_lock:
+            in_flight -= 1
+
+    def send_json(self, status, body, headers=None):
+        self.send_payload(status, json.dumps(body).encode('utf-8'), headers)
+
+    def send_payload(self, status, payload, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    # The default backlog of 5 refuses connections when many clients connect at once
+    request_queue_size = REQUEST_QUEUE_SIZE
+
+
+def serve(host=HOST, port=PORT):
+    """Start the stub server in a background thread and return it."""
+    server = StubServer((host, port), EmbeddingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    server = serve()
+    print(f"Stub embedding server on http://{HOST}:{PORT}/v1 ({DIMENSIONS} dimensions, {POOL_SIZE} distinct vectors)")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"{stats['requests']} requests, {stats['inputs']} inputs, "
+                  f"{stats['throttled']} throttled, {stats['errors']} errors")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import os
 import openai
 from neo4j_haystack import Neo4jDocumentStore, Neo4jDynamicDocumentRetriever, Neo4jClientConfig
 from haystack.components.embedders import OpenAITextEmbedder
+from embedding_cache import CachedTextEmbedder
 from haystack.utils.auth import Secret
 from haystack import Pipeline
 from neo4j import GraphDatabase
@@ -74,10 +75,10 @@ def perform_vector_search(query):
     print(f"Documents count: {document_store.count_documents()}")
 
     
-    text_embedder = OpenAITextEmbedder(
+    text_embedder = CachedTextEmbedder(OpenAITextEmbedder(
         api_key=Secret.from_env_var("OPENAI_API_KEY"),
         model="text-embedding-ada-002"
-    )
+    ))
 
     # Step 1: Create embedding for the query
     query_embedding = text_embedder.run(query).get("embedding")
@@ -121,10 +122,10 @@ def perform_vector_search_cypher(query):
             RETURN movie.title AS title, movie.overview AS overview, score
         """
 
-    text_embedder = OpenAITextEmbedder(
+    text_embedder = CachedTextEmbedder(OpenAITextEmbedder(
         api_key=Secret.from_env_var("OPENAI_API_KEY"),
         model="text-embedding-ada-002"
-    )
+    ))
 
 
     retriever = Neo4jDynamicDocumentRetriever(
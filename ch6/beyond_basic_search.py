@@ -147,6 +147,65 @@ def perform_optimized_search(query, top_k):
         overview = doc.meta.get("overview", "N/A")
         print(f"Title: {title}\nOverview: {overview}\n{'-'*40}")
 
+# Step 5: Keyword-Constrained and Keyword-Boosted Search
+def keyword_query(keywords):
+    # Quote each keyword as a phrase for the keyword_names fulltext index
+    phrases = ['"' + keyword.replace('\\', '\\\\').replace('"', '\\"') + '"' for keyword in keywords]
+    return " OR ".join(phrases)
+
+
+def perform_keyword_constrained_search(query, keywords, top_k=5):
+    # Only movies tagged with one of the keywords are scored against the query
+    query_embedding = text_embedder.run(query).get("embedding")
+    if query_embedding is None:
+        print("Query embedding not created successfully.")
+        return
+
+    cypher_query = """
+    CALL db.index.fulltext.queryNodes("keyword_names", $keywordQuery) YIELD node AS k
+    MATCH (k)<-[:HAS_KEYWORD]-(movie:Movie)
+    WHERE movie.embedding IS NOT NULL
+    WITH movie, collect(DISTINCT k.name) AS matched
+    RETURN movie.title AS title, movie.overview AS overview, matched,
+           vector.similarity.cosine(movie.embedding, $queryEmbedding) AS score
+    ORDER BY score DESC
+    LIMIT $topK
+    """
+    with driver.session() as session:
+        results = session.run(cypher_query, keywordQuery=keyword_query(keywords),
+                              queryEmbedding=query_embedding, topK=top_k)
+        for record in results:
+            print(f"Title: {record['title']}\nKeywords: {', '.join(record['matched'])}\n"
+                  f"Overview: {record['overview']}\nScore: {record['score']:.2f}\n{'-'*40}")
+
+
+def perform_keyword_boosted_search(query, keywords, top_k=5, candidates=50, boost=0.05):
+    # Vector search as usual, with every matching keyword adding to the score
+    query_embedding = text_embedder.run(query).get("embedding")
+    if query_embedding is None:
+        print("Query embedding not created successfully.")
+        return
+
+    cypher_query = """
+    CALL db.index.fulltext.queryNodes("keyword_names", $keywordQuery) YIELD node AS k
+    WITH collect(k) AS keywords
+    CALL db.index.vector.queryNodes("overview_embeddings", $candidates, $queryEmbedding)
+    YIELD node AS movie, score
+    OPTIONAL MATCH (movie)-[:HAS_KEYWORD]->(k:Keyword)
+    WHERE k IN keywords
+    WITH movie, score, collect(k.name) AS matched
+    RETURN movie.title AS title, movie.overview AS overview, matched,
+           score + $boost * size(matched) AS score
+    ORDER BY score DESC
+    LIMIT $topK
+    """
+    with driver.session() as session:
+        results = session.run(cypher_query, keywordQuery=keyword_query(keywords), queryEmbedding=query_embedding,
+                              candidates=candidates, boost=boost, topK=top_k)
+        for record in results:
+            print(f"Title: {record['title']}\nKeywords: {', '.join(record['matched']) or 'None'}\n"
+                  f"Overview: {record['overview']}\nScore: {record['score']:.2f}\n{'-'*40}")
+
 # Main function to execute all use cases
 def main():
     movie_title = "Jurassic Park"
@@ -161,5 +220,11 @@ def main():
     print("=== Optimized Search for Recommendations ===")
     perform_optimized_search("Recommend movies about time travel", 10)
 
+    print("=== Keyword-Constrained Search ===")
+    perform_keyword_constrained_search("Movies about space exploration", ["astronaut", "space travel"])
+
+    print("=== Keyword-Boosted Search ===")
+    perform_keyword_boosted_search("Recommend movies about time travel", ["time travel"])
+
 if __name__ == "__main__":
     main()
\ No newline at end of file